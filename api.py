@@ -4,7 +4,7 @@ from blueprints import v0, main
 from docs import create_docs
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
-from common.helpers import make_error_object, respond
+from common.helpers import make_error_object, respond, init_metrics
 from common.db_schema import db
 from common.schemas import *
 from auth import db_connection_string
@@ -37,6 +37,9 @@ def create_app(config_filename=None):
     if config_filename:
         app.config.from_pyfile(config_filename)
 
+    # before the rate limiter, so that rate limited requests are counted too
+    init_metrics(app)
+
     limiter = Limiter(get_remote_address, app=app, default_limits=[
                   "500/hour", "100/minute"], headers_enabled=True)
 
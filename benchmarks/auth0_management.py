@@ -0,0 +1,68 @@
+"""
+Benchmarks Auth0ManagementService.get_roles_for_user against the fake management API in benchmarks/fake_auth0.py.
+
+The pooled client is compared to making a new connection for every call (what the service did before it used a session).
+
+Usage: python -m benchmarks.auth0_management [--calls 500] [--latency 0.0]
+"""
+import argparse
+import statistics
+import time
+
+import requests
+
+from benchmarks.fake_auth0 import start_server
+from common.services.auth0management import Auth0ManagementService
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name, samples, connections):
+    print("%-12s calls=%d mean=%.3fms p50=%.3fms p95=%.3fms p99=%.3fms connections=%d" % (
+        name,
+        len(samples),
+        statistics.mean(samples) * 1000,
+        percentile(samples, 50) * 1000,
+        percentile(samples, 95) * 1000,
+        percentile(samples, 99) * 1000,
+        connections
+    ))
+
+
+def run(calls, latency):
+    server, state = start_server(latency=latency, roles={"auth0|bench": ["admin"]})
+    domain = "127.0.0.1:%d" % server.server_port
+
+    client = Auth0ManagementService(domain=domain, client_id="bench", client_secret="bench", scheme="http")
+
+    # unpooled: a fresh connection for every call
+    url = client.base_url + "/users/auth0|bench/roles"
+    headers = {**Auth0ManagementService.headers, "Authorization": "Bearer " + client.access_token}
+    connections_before = state.connections
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        requests.get(url, headers=headers).json()
+        samples.append(time.perf_counter() - start)
+    report("unpooled", samples, state.connections - connections_before)
+
+    connections_before = state.connections
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        client.get_roles_for_user("auth0|bench")
+        samples.append(time.perf_counter() - start)
+    report("pooled", samples, state.connections - connections_before)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the Auth0 management API client against a local fake.')
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds of simulated server latency per request')
+    args = parser.parse_args()
+    run(args.calls, args.latency)
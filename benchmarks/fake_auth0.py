@@ -0,0 +1,146 @@
+"""
+A local stand-in for the parts of the Auth0 API that the ClassClock API talks to, for benchmarking offline.
+
+Serves:
+- POST /oauth/token (client credentials grant)
+- GET /api/v2/users/<user_id>
+- GET /api/v2/users/<user_id>/roles
+
+Run it on its own with `python -m benchmarks.fake_auth0 --port 8001`, or start it from another script with `start_server()`.
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeAuth0State:
+    def __init__(self, latency=0.0, token_lifetime=86400, roles=None):
+        """
+        Keyword Arguments:
+            latency {float} -- seconds to wait before answering every request, to simulate the network (default: {0.0})
+            token_lifetime {int} -- the expires_in value given to issued access tokens (default: {86400})
+            roles {dict} -- a map of user IDs to the list of role names they have. Unknown users have no roles (default: {None})
+        """
+        self.latency = latency
+        self.token_lifetime = token_lifetime
+        self.roles = roles or {}
+        self.tokens = {}
+        self.lock = threading.Lock()
+        self.token_requests = 0
+        self.api_requests = 0
+        self.connections = 0
+
+
+class FakeAuth0Handler(BaseHTTPRequestHandler):
+    # keep-alive needs HTTP/1.1
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, which stalls keep-alive connections on delayed ACKs otherwise
+    disable_nagle_algorithm = True
+
+    state = None
+
+    def setup(self):
+        super().setup()
+        with self.state.lock:
+            self.state.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, code, data):
+        body = json.dumps(data).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return self.rfile.read(length) if length else b""
+
+    def do_POST(self):
+        body = self._read_body()
+        time.sleep(self.state.latency)
+
+        if self.path != "/oauth/token":
+            return self._send_json(404, {"statusCode": 404, "message": "Not Found"})
+
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            payload = {}
+        if payload.get("grant_type") != "client_credentials":
+            return self._send_json(403, {"error": "unauthorized_client", "error_description": "Grant type not allowed"})
+
+        token = uuid.uuid4().hex
+        with self.state.lock:
+            self.state.token_requests += 1
+            self.state.tokens[token] = time.time() + self.state.token_lifetime
+
+        self._send_json(200, {
+            "access_token": token,
+            "expires_in": self.state.token_lifetime,
+            "token_type": "Bearer"
+        })
+
+    def do_GET(self):
+        time.sleep(self.state.latency)
+
+        with self.state.lock:
+            self.state.api_requests += 1
+            expires_at = self.state.tokens.get(self.headers.get("Authorization", "")[len("Bearer "):])
+
+        if expires_at is None:
+            return self._send_json(401, {"statusCode": 401, "error": "Unauthorized", "message": "Invalid token"})
+        if expires_at < time.time():
+            return self._send_json(401, {"statusCode": 401, "error": "Unauthorized", "message": "Expired token received for JSON Web Token validation"})
+
+        parts = self.path.split("/")
+        # ['', 'api', 'v2', 'users', <user_id>, ('roles')]
+        if len(parts) < 5 or parts[1:4] != ["api", "v2", "users"]:
+            return self._send_json(404, {"statusCode": 404, "message": "Not Found"})
+
+        user_id = parts[4]
+        if len(parts) == 6 and parts[5] == "roles":
+            roles = [{"id": "rol_" + name, "name": name, "description": name} for name in self.state.roles.get(user_id, [])]
+            return self._send_json(200, roles)
+
+        self._send_json(200, {"user_id": user_id, "email": user_id + "@example.com"})
+
+
+def start_server(port=0, **state_options):
+    """Starts the fake API on a background thread
+
+    Keyword Arguments:
+        port {int} -- the port to listen on. 0 picks a free one (default: {0})
+        state_options -- passed on to FakeAuth0State
+
+    Returns:
+        (ThreadingHTTPServer, FakeAuth0State) -- the running server and its state. Call shutdown() on the server to stop it.
+    """
+    state = FakeAuth0State(**state_options)
+    handler = type("BoundFakeAuth0Handler", (FakeAuth0Handler,), {"state": state})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-auth0", daemon=True).start()
+    return server, state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a fake Auth0 management API for local benchmarking.')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds of simulated latency per request')
+    parser.add_argument('--token-lifetime', type=int, default=86400, help='expires_in value for issued tokens')
+    args = parser.parse_args()
+
+    server, state = start_server(args.port, latency=args.latency, token_lifetime=args.token_lifetime)
+    print("Fake Auth0 API listening on http://127.0.0.1:%d" % server.server_port)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,99 @@
+"""
+Benchmarks the per-value cost of converting IDs with common.guid.HashColumn on each database dialect,
+compared to the previous implementation that went through uuid.UUID for every value, and the cost of
+looking up a chunk of IDs with a bound `IN (...)` compared to common.guid.in_ids on SQLite.
+
+The conversions are timed without a database server by calling the type's hooks with each dialect.
+On PostgreSQL the previous implementation bound 16 raw bytes to a native UUID column and could not
+read UUIDs back, so there is nothing to compare it to there.
+
+Usage: python -m benchmarks.hash_column [--values 100000] [--rows 20000] [--chunk 500] [--rounds 20]
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+from sqlalchemy import create_engine, Table, Column, MetaData, Integer, select, types
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from common.guid import HashColumn, in_ids
+
+
+class PreviousHashColumn(types.TypeDecorator):
+    """HashColumn as it was before it was rewritten, for comparison"""
+    impl = types.CHAR
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return value
+        elif dialect.name == 'postgresql':
+            return uuid.UUID(value).bytes
+        else:
+            if not isinstance(value, uuid.UUID):
+                return uuid.UUID(value).bytes
+            else:
+                return value.bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return value
+        else:
+            return uuid.UUID(bytes=value).hex
+
+
+def per_value(func, values):
+    start = time.perf_counter()
+    for value in values:
+        func(value)
+    return (time.perf_counter() - start) / len(values) * 1e9
+
+
+def bench_conversions(count):
+    ids = [uuid.uuid4().hex for _ in range(count)]
+    raw = [bytes.fromhex(i) for i in ids]
+    hyphenated = [str(uuid.UUID(i)) for i in ids]
+
+    for name, dialect in (("sqlite", sqlite.dialect()), ("mysql", mysql.dialect()), ("postgresql", postgresql.dialect())):
+        new, old = HashColumn(), PreviousHashColumn()
+        stored = hyphenated if name == "postgresql" else raw
+        rows = [
+            ("bind", per_value(lambda v: new.process_bind_param(v, dialect), ids),
+             None if name == "postgresql" else per_value(lambda v: old.process_bind_param(v, dialect), ids)),
+            ("result", per_value(lambda v: new.process_result_value(v, dialect), stored),
+             None if name == "postgresql" else per_value(lambda v: old.process_result_value(v, dialect), stored)),
+        ]
+        for step, new_ns, old_ns in rows:
+            print("%-10s %-6s before=%s after=%.0fns/value" % (name, step, "n/a" if old_ns is None else "%.0fns/value" % old_ns, new_ns))
+
+
+def bench_in(rows, chunk, rounds):
+    engine = create_engine("sqlite://")
+    metadata = MetaData()
+    table = Table("ids", metadata, Column("id", HashColumn(length=32), primary_key=True), Column("n", Integer))
+    metadata.create_all(engine)
+    ids = [uuid.uuid4().hex for _ in range(rows)]
+    with engine.begin() as connection:
+        connection.execute(table.insert(), [{"id": i, "n": n} for n, i in enumerate(ids)])
+
+    lookup = ids[:chunk]
+    for name, clause in (("bound", lambda: table.c.id.in_(lookup)), ("literal", lambda: in_ids(table.c.id, lookup))):
+        samples = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            with engine.connect() as connection:
+                found = connection.execute(select([table.c.id]).where(clause())).fetchall()
+            samples.append(time.perf_counter() - start)
+        assert len(found) == chunk
+        print("sqlite IN (%d ids) %-7s mean=%.2fms min=%.2fms" % (chunk, name, statistics.mean(samples) * 1000, min(samples) * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark HashColumn conversions.')
+    parser.add_argument('--values', type=int, default=100000, help='IDs to convert per dialect')
+    parser.add_argument('--rows', type=int, default=20000, help='rows in the SQLite table for the IN benchmark')
+    parser.add_argument('--chunk', type=int, default=500, help='IDs to look up at once')
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+    bench_conversions(args.values)
+    bench_in(args.rows, args.chunk, args.rounds)
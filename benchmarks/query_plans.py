@@ -0,0 +1,133 @@
+"""
+Checks that every SQL statement the /v0 routes run can use an index, by sending each of the requests
+from benchmarks/routes.py once (against the same seeded in-memory SQLite database) and asking SQLite
+for the query plan of every SELECT, UPDATE and DELETE statement along the way.
+
+A statement fails the check if its plan reads a whole table without an index (`SCAN <table>`), or
+if its only constraint is on soft_deleted, which is true for nearly every row and so narrows nothing
+down (listing every school that isn't deleted, the one time that is what's wanted, is allowed).
+Scanning a covering index, i.e. to count every school for the version of the school listing, is
+allowed. A route also fails if its statements don't use the indexes in EXPECTED_INDEXES that were
+added for it. The exit code is 1 if anything fails.
+
+The plans are SQLite's, but a statement that SQLite can answer from an index can be answered from
+the same index on MySQL and PostgreSQL.
+
+Usage: python -m benchmarks.query_plans [--verbose]
+"""
+import argparse
+import re
+import sys
+
+from benchmarks import routes
+
+# reads a whole table. Newer versions of SQLite leave out "TABLE"
+FULL_SCAN = re.compile(r"^SCAN (?:TABLE )?\w+(?: AS \w+)?$")
+CHECKED_STATEMENTS = ("SELECT", "UPDATE", "DELETE")
+# searches a table by soft_deleted alone
+SOFT_DELETED_ONLY = re.compile(r"^SEARCH \w+(?: AS \w+)? USING (?:COVERING )?INDEX \w+ \(soft_deleted=\?\)$")
+# the routes that list every row that isn't deleted
+FULL_LISTINGS = {"list_schools", "list_schools_fields", "list_schools_page"}
+# route name -> indexes that at least one of its statements has to use
+EXPECTED_INDEXES = {
+    "search_schools": {"ix_schools_soft_deleted_school_name_search", "ix_schools_soft_deleted_school_acronym_search"},
+    "list_bellschedules": {"ix_bellschedules_school_id_soft_deleted"},
+    "list_bellschedules_range": {"ix_bellschedules_school_id_soft_deleted"},
+    "list_owned_bellschedules": {"ix_schools_owner_id_soft_deleted_school_id"},
+    "create_bellschedule": {"ix_schools_owner_id_soft_deleted_school_id"},
+    "get_schedule_for_date": {"ix_bellscheduledates_date_bell_schedule_id"},
+}
+INDEX_NAME = re.compile(r"USING (?:COVERING )?INDEX (\w+)")
+
+
+class Args:
+    schools = 5
+    schedules = 3
+    dates = 10
+    meeting_times = 2
+
+
+def capture_statements(app, token, routes_to_send):
+    """Sends every request once and returns the statements that were run, as a dict of (statement, parameters) -> the names of the routes that ran it"""
+    from sqlalchemy import event
+    from common.db_schema import db
+
+    statements = {}
+    current = [None]
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if current[0] is not None and not executemany and statement.lstrip().upper().startswith(CHECKED_STATEMENTS):
+            statements.setdefault((statement, tuple(parameters)), set()).add(current[0])
+
+    with app.app_context():
+        event.listen(db.get_engine(app), "before_cursor_execute", record)
+
+    client = app.test_client()
+    for route in routes_to_send:
+        target = route.setup(route) if route.setup else None
+        headers = {"Authorization": "Bearer " + token} if route.auth else {}
+        current[0] = route.name
+        response = client.open(route.path(target), method=route.method, json=route.body(target) if route.body else None, headers=headers)
+        response.get_data()
+        current[0] = None
+        if response.status_code != route.status:
+            raise AssertionError("%s returned %d: %s" % (route.name, response.status_code, response.get_data(as_text=True)[:500]))
+    return statements
+
+
+def explain(app, statement, parameters):
+    from common.db_schema import db
+
+    with app.app_context():
+        connection = db.get_engine(app).raw_connection()
+        try:
+            cursor = connection.cursor()
+            cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+            return [row[-1] for row in cursor.fetchall()]
+        finally:
+            connection.close()
+
+
+def run(verbose):
+    app, token = routes.load_app(response_cache=False)
+    with app.app_context():
+        school_id, schedule_ids = routes.seed(Args.schools, Args.schedules, Args.dates, Args.meeting_times)
+    to_send = routes.make_routes(app, school_id, schedule_ids, Args) + [
+        routes.Route("search_schools", "GET", lambda _: "/v0/schools?q=Benchmark"),
+        routes.Route("list_bellschedules_range", "GET", lambda _: "/v0/bellschedules/%s?from=2024-01-01&to=2024-01-05" % school_id),
+    ]
+
+    statements = capture_statements(app, token, to_send)
+    failures = 0
+    # route name -> the indexes its statements used
+    used_indexes = {}
+    for (statement, parameters), names in statements.items():
+        plan = explain(app, statement, parameters)
+        scanned = any(FULL_SCAN.match(line) for line in plan)
+        unselective = not names <= FULL_LISTINGS and any(SOFT_DELETED_ONLY.match(line) for line in plan)
+        failed = scanned or unselective
+        failures += failed
+        for name in names:
+            used_indexes.setdefault(name, set()).update(match.group(1) for line in plan for match in INDEX_NAME.finditer(line))
+        if verbose or failed:
+            print("%s (%s): %s" % ("FAIL" if failed else "ok", ", ".join(sorted(names)), " ".join(statement.split())))
+            for line in plan:
+                print("    " + line)
+
+    missing_indexes = 0
+    for name, expected in sorted(EXPECTED_INDEXES.items()):
+        unused = expected - used_indexes.get(name, set())
+        if unused:
+            missing_indexes += 1
+            print("FAIL %s doesn't use %s" % (name, ", ".join(sorted(unused))))
+
+    print("%d statements checked, %d scan a table without an index or by soft_deleted alone, %d routes don't use their indexes" % (
+        len(statements), failures, missing_indexes))
+    return failures == 0 and missing_indexes == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check that the SQL statements of the /v0 routes use indexes on SQLite.')
+    parser.add_argument('--verbose', action='store_true', help='print the plan of every statement, not just the ones that scan a table')
+    args = parser.parse_args()
+    sys.exit(0 if run(args.verbose) else 1)
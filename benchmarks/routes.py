@@ -0,0 +1,439 @@
+"""
+Benchmarks every /v0 route through the Flask test client, against an in-memory SQLite database seeded
+with a synthetic dataset (N schools, each with M bell schedules of D dates and P meeting times).
+
+For each route it reports latency percentiles, the number of SQL statements per request and the peak
+memory allocated (with tracemalloc) while handling one request. Tokens are signed with a key that is
+generated on startup and verified offline through AUTH0_JWKS, so no network access is needed. The
+response cache is disabled unless --response-cache is passed, so that repeated requests measure the
+routes themselves.
+
+It exits with an error if a route fails, or sends more SQL statements than it is allowed in
+MAX_QUERIES. These numbers don't depend on the size of the dataset, so a route that starts loading
+the rows of a relationship one by one (N+1 queries) fails instead of only printing a bigger number.
+
+--compare runs the benchmark against one or two git revisions (or one revision and the working tree)
+by checking each out into a temporary git worktree and running this file against it in a separate
+process, then prints the results side by side. Revisions from before tokens could be verified offline
+with AUTH0_JWKS can't be benchmarked.
+
+Usage: python -m benchmarks.routes [--schools 20] [--schedules 10] [--dates 180] [--meeting-times 8]
+                                   [--rounds 50] [--warmup 3] [--route NAME ...] [--response-cache] [--json FILE]
+       python -m benchmarks.routes --compare REV [REV] [options]
+"""
+import argparse
+import base64
+import datetime
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OWNER = "auth0|bench0"
+ROLES_CLAIM = "https://bench.invalid/roles"
+FIRST_DATE = datetime.date(2024, 1, 1)
+
+
+# the SQL statements each route may send per request, whatever the size of the dataset
+MAX_QUERIES = {
+    "ping": 0,
+    "list_schools": 2,
+    "list_schools_page": 2,
+    "list_schools_fields": 2,
+    "get_school": 1,
+    # the schedules, with their dates and meeting times loaded in one statement each
+    "list_bellschedules": 4,
+    "list_owned_bellschedules": 4,
+    "get_bellschedule": 3,
+    "get_bellschedules_by_id": 4,
+    "get_schedule_for_date": 1,
+    "get_schedule_for_range": 2,
+    "create_school": 2,
+    "update_school": 3,
+    "delete_school": 3,
+    # the dates and meeting times are inserted with one statement each, and nothing in the payload is looked
+    # up (benchmarks/schema_loads.py checks how payloads are resolved against stored meeting times)
+    "create_bellschedule": 8,
+    "update_bellschedule": 9,
+    "delete_bellschedule": 2,
+}
+
+
+def _b64(number):
+    raw = number.to_bytes((number.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def make_signing_key():
+    """Generates an RS256 key pair
+
+    Returns:
+        tuple -- the private key (PEM) and the JWKS document with the public key
+    """
+    import rsa
+    public, private = rsa.newkeys(2048)
+    jwks = {"keys": [{"kty": "RSA", "kid": "bench", "use": "sig", "alg": "RS256", "n": _b64(public.n), "e": _b64(public.e)}]}
+    return private.save_pkcs1().decode("ascii"), jwks
+
+
+def make_token(private_key, permissions):
+    from jose import jwt
+    claims = {
+        "sub": OWNER,
+        "azp": "bench",
+        "aud": os.environ["API_IDENTIFIER"],
+        "iss": "https://" + os.environ["AUTH0_DOMAIN"] + "/",
+        "exp": int(time.time()) + 24 * 3600,
+        "permissions": permissions,
+        ROLES_CLAIM: ["admin"],
+    }
+    return jwt.encode(claims, private_key, algorithm="RS256", headers={"kid": "bench"})
+
+
+def load_app(response_cache):
+    """Configures the environment for an offline, in-memory app, then creates it
+
+    This has to happen before the app is imported, because the helpers read their configuration at import time.
+
+    Returns:
+        tuple -- the app and a token that is allowed to do anything
+    """
+    private_key, jwks = make_signing_key()
+    os.environ["DATABASE_URL"] = "sqlite://"
+    os.environ["AUTH0_JWKS"] = json.dumps(jwks)
+    os.environ["AUTH0_DOMAIN"] = "bench.invalid"
+    os.environ["API_IDENTIFIER"] = "https://bench.invalid/api"
+    # offline mode reads the roles for admin checks from this claim
+    os.environ["AUTH0_ROLES_CLAIM"] = ROLES_CLAIM
+    os.environ.pop("AUTH0_JWKS_FILE", None)
+    os.environ.pop("INVALIDATION_BUS_URL", None)
+    if not response_cache:
+        os.environ["RESPONSE_CACHE_SIZE"] = "0"
+
+    from api import create_app
+    from common.constants import APIScopes
+
+    # the rate limits would otherwise reject most of the requests
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as config:
+        config.write("RATELIMIT_ENABLED = False\n")
+    try:
+        app = create_app(config.name)
+    finally:
+        os.unlink(config.name)
+    # every request is logged at INFO level
+    app.logger.setLevel(logging.WARNING)
+
+    return app, make_token(private_key, [scope.value for scope in APIScopes])
+
+
+def make_schedule(school, index, dates, meeting_times, first_date=FIRST_DATE):
+    from common.db_schema import BellSchedule, BellScheduleDate, BellScheduleMeetingTime
+    now = datetime.datetime.utcnow()
+    schedule = BellSchedule(full_name="Schedule %d" % index, display_name="S%d" % index)
+    schedule.dates = [BellScheduleDate(date=first_date + datetime.timedelta(days=d), creation_date=now) for d in range(dates)]
+    schedule.meeting_times = [
+        BellScheduleMeetingTime(name="Period %d" % p, start_time=datetime.time(8 + p % 12, 0), end_time=datetime.time(8 + p % 12, 50), creation_date=now)
+        for p in range(meeting_times)
+    ]
+    school.schedules.append(schedule)
+    return schedule
+
+
+def seed(schools, schedules, dates, meeting_times):
+    """Fills the database with schools, the first of which is owned by the benchmark user
+
+    Returns:
+        tuple -- the id of the owned school and the ids of its bell schedules
+    """
+    from common.db_schema import db, School
+
+    db.create_all()
+    owned = None
+    for s in range(schools):
+        school = School(owner_id="auth0|bench%d" % s, full_name="Benchmark School %d" % s, acronym="BS%d" % s)
+        for m in range(schedules):
+            # each schedule covers its own range of dates
+            make_schedule(school, m, dates, meeting_times, FIRST_DATE + datetime.timedelta(days=m * dates))
+        db.session.add(school)
+        if owned is None:
+            owned = school
+    db.session.commit()
+    return owned.id, [schedule.id for schedule in owned.schedules]
+
+
+class Route:
+    """A request to benchmark
+
+    `path` and `body` are functions of the target that `setup` returns (by default, nothing) for every request,
+    so that i.e. each DELETE request deletes a different object.
+    """
+
+    def __init__(self, name, method, path, body=None, auth=False, status=200, setup=None):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.body = body
+        self.auth = auth
+        self.status = status
+        self.setup = setup
+
+
+def make_routes(app, school_id, schedule_ids, args):
+    from common.db_schema import db, School
+
+    last_date = FIRST_DATE + datetime.timedelta(days=args.dates - 1)
+    counter = [0]
+
+    def next_index():
+        counter[0] += 1
+        return counter[0]
+
+    def new_school(_):
+        with app.app_context():
+            school = School(owner_id=OWNER, full_name="Disposable School", acronym="DS")
+            db.session.add(school)
+            db.session.commit()
+            return school.id
+
+    def new_schedule(_):
+        with app.app_context():
+            school = School.query.get(school_id)
+            schedule = make_schedule(school, next_index(), args.dates, args.meeting_times, datetime.date(2000, 1, 1))
+            db.session.commit()
+            return schedule.id
+
+    def schedule_body(target):
+        i = next_index()
+        return {
+            "school_id": school_id,
+            "name": "Benchmark Schedule %d" % i,
+            "display_name": "B%d" % i,
+            "dates": [(datetime.date(2100, 1, 1) + datetime.timedelta(days=i * args.dates + d)).isoformat() for d in range(args.dates)],
+            "meeting_times": [
+                {"name": "Period %d" % p, "start_time": "%02d:00:00" % (8 + p % 12), "end_time": "%02d:50:00" % (8 + p % 12)}
+                for p in range(args.meeting_times)
+            ],
+        }
+
+    def schedule_update(target):
+        # moves the last date of the schedule back and forth, so every request changes one date
+        i = next_index()
+        dates = [(FIRST_DATE + datetime.timedelta(days=d)).isoformat() for d in range(args.dates - 1)]
+        dates.append((last_date + datetime.timedelta(days=i % 2 * 1000)).isoformat())
+        return {"id": schedule_ids[0], "name": "Schedule %d" % i, "dates": dates}
+
+    return [
+        Route("ping", "GET", lambda _: "/v0/ping"),
+        Route("list_schools", "GET", lambda _: "/v0/schools"),
+        Route("list_schools_page", "GET", lambda _: "/v0/schools?limit=20"),
+        Route("list_schools_fields", "GET", lambda _: "/v0/schools?fields=id,full_name,acronym"),
+        Route("get_school", "GET", lambda _: "/v0/school/" + school_id),
+        Route("list_bellschedules", "GET", lambda _: "/v0/bellschedules/" + school_id),
+        Route("list_owned_bellschedules", "GET", lambda _: "/v0/bellschedules", auth=True),
+        Route("get_bellschedule", "GET", lambda _: "/v0/bellschedule/" + schedule_ids[0]),
+        Route("get_bellschedules_by_id", "GET", lambda _: "/v0/bellschedules?ids=" + ",".join(schedule_ids)),
+        Route("get_schedule_for_date", "GET", lambda _: "/v0/school/%s/schedule?date=%s" % (school_id, FIRST_DATE.isoformat())),
+        Route("get_schedule_for_range", "GET", lambda _: "/v0/school/%s/schedule?from=%s&to=%s" % (
+            school_id, FIRST_DATE.isoformat(), (FIRST_DATE + datetime.timedelta(days=365)).isoformat())),
+        Route("create_school", "POST", lambda _: "/v0/school", body=lambda _: {"full_name": "New School %d" % next_index(), "acronym": "NS"}, auth=True),
+        Route("update_school", "PATCH", lambda _: "/v0/school/" + school_id, body=lambda _: {"full_name": "Benchmark School %d" % next_index()}, auth=True),
+        Route("delete_school", "DELETE", lambda target: "/v0/school/" + target, auth=True, status=204, setup=new_school),
+        Route("create_bellschedule", "POST", lambda _: "/v0/bellschedule", body=schedule_body, auth=True),
+        Route("update_bellschedule", "PATCH", lambda _: "/v0/bellschedule/" + schedule_ids[0], body=schedule_update, auth=True),
+        Route("delete_bellschedule", "DELETE", lambda target: "/v0/bellschedule/" + target, auth=True, status=204, setup=new_schedule),
+    ]
+
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def bench_route(client, route, token, rounds, warmup, queries):
+    headers = {"Authorization": "Bearer " + token} if route.auth else {}
+
+    def send(traced=False):
+        target = route.setup(route) if route.setup else None
+        body = route.body(target) if route.body else None
+        before = queries[0]
+        if traced:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            response = client.open(route.path(target), method=route.method, json=body, headers=headers)
+            response.get_data()
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if traced else None
+            if traced:
+                tracemalloc.stop()
+        if response.status_code != route.status:
+            raise AssertionError("%s %s returned %d instead of %d: %s" % (
+                route.method, route.path(target), response.status_code, route.status, response.get_data(as_text=True)[:500]))
+        return elapsed, queries[0] - before, peak, len(response.get_data())
+
+    for _ in range(warmup):
+        send()
+    samples = [send() for _ in range(rounds)]
+    # tracing slows everything down, so allocations are measured on separate requests
+    peaks = [send(traced=True)[2] for _ in range(min(rounds, 5))]
+
+    times = [s[0] for s in samples]
+    return {
+        "p50_ms": percentile(times, 50) * 1000,
+        "p90_ms": percentile(times, 90) * 1000,
+        "p99_ms": percentile(times, 99) * 1000,
+        "queries": max(s[1] for s in samples),
+        "peak_kib": percentile(peaks, 50) / 1024,
+        "bytes": samples[-1][3],
+    }
+
+
+def run(args):
+    from sqlalchemy import event
+
+    app, token = load_app(args.response_cache)
+    from common.db_schema import db
+    with app.app_context():
+        start = time.perf_counter()
+        school_id, schedule_ids = seed(args.schools, args.schedules, args.dates, args.meeting_times)
+        print("seeded %d schools x %d schedules x %d dates x %d meeting times in %.1fs" % (
+            args.schools, args.schedules, args.dates, args.meeting_times, time.perf_counter() - start), file=sys.stderr)
+
+        queries = [0]
+
+        def count(*_):
+            queries[0] += 1
+        event.listen(db.get_engine(app), "before_cursor_execute", count)
+
+    routes = make_routes(app, school_id, schedule_ids, args)
+    if args.route:
+        unknown = set(args.route) - {route.name for route in routes}
+        if unknown:
+            raise SystemExit("unknown routes: " + ", ".join(sorted(unknown)))
+        routes = [route for route in routes if route.name in args.route]
+
+    client = app.test_client()
+    results = {}
+    for route in routes:
+        try:
+            results[route.name] = bench_route(client, route, token, args.rounds, args.warmup, queries)
+        except Exception as e:
+            # keep going, so that a route that is broken in one revision doesn't stop a comparison
+            results[route.name] = {"error": "%s: %s" % (type(e).__name__, e)}
+
+    return {"config": {key: getattr(args, key) for key in CONFIG_KEYS}, "routes": results}
+
+
+CONFIG_KEYS = ("schools", "schedules", "dates", "meeting_times", "rounds", "warmup", "response_cache")
+COLUMNS = (("p50_ms", "%.2f"), ("p90_ms", "%.2f"), ("p99_ms", "%.2f"), ("queries", "%d"), ("peak_kib", "%.0f"), ("bytes", "%d"))
+
+
+def print_results(results):
+    print("%-26s" % "route" + "".join("%12s" % name for name, _ in COLUMNS))
+    for name, row in results["routes"].items():
+        if "error" in row:
+            print("%-26s  failed: %s" % (name, row["error"][:200]))
+        else:
+            print("%-26s" % name + "".join("%12s" % (fmt % row[key]) for key, fmt in COLUMNS))
+
+
+def check_results(results):
+    """Returns a description of every route that failed or sent more SQL statements than MAX_QUERIES allows"""
+    problems = []
+    for name, row in results["routes"].items():
+        if "error" in row:
+            problems.append("%s failed" % name)
+        elif name not in MAX_QUERIES:
+            problems.append("%s has no entry in MAX_QUERIES" % name)
+        elif row["queries"] > MAX_QUERIES[name]:
+            problems.append("%s sent %d SQL statements per request instead of at most %d" % (name, row["queries"], MAX_QUERIES[name]))
+    return problems
+
+
+def run_revision(revision, args):
+    """Runs the benchmark in a separate process against a revision (or the working tree if it is None) and returns its results"""
+    options = ["--schools", str(args.schools), "--schedules", str(args.schedules), "--dates", str(args.dates),
+               "--meeting-times", str(args.meeting_times), "--rounds", str(args.rounds), "--warmup", str(args.warmup)]
+    if args.response_cache:
+        options.append("--response-cache")
+    for name in args.route or ():
+        options += ["--route", name]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "results.json")
+        tree = REPO
+        if revision is not None:
+            tree = os.path.join(tmp, "tree")
+            subprocess.run(["git", "worktree", "add", "--detach", "--quiet", tree, revision], cwd=REPO, check=True)
+        try:
+            print("benchmarking %s" % (revision or "the working tree"), file=sys.stderr)
+            subprocess.run([sys.executable, os.path.abspath(__file__), "--app-dir", tree, "--json", output] + options, cwd=tree, check=True)
+            with open(output) as results:
+                return json.load(results)
+        finally:
+            if revision is not None:
+                subprocess.run(["git", "worktree", "remove", "--force", tree], cwd=REPO, check=True)
+
+
+def compare(revisions, args):
+    if len(revisions) == 1:
+        revisions = revisions + [None]
+    before, after = [run_revision(revision, args) for revision in revisions]
+    labels = [revision or "working tree" for revision in revisions]
+    print("%s -> %s" % tuple(labels))
+    print("%-26s%22s%16s%22s" % ("route", "p50_ms", "queries", "peak_kib"))
+    for name, new in after["routes"].items():
+        old = before["routes"].get(name)
+        if old is None:
+            continue
+        if "error" in old or "error" in new:
+            print("%-26s  %s -> %s" % (name, "failed" if "error" in old else "ok", "failed" if "error" in new else "ok"))
+            continue
+        change = (new["p50_ms"] / old["p50_ms"] - 1) * 100 if old["p50_ms"] else 0
+        print("%-26s%22s%16s%22s" % (
+            name,
+            "%.2f -> %.2f (%+.0f%%)" % (old["p50_ms"], new["p50_ms"], change),
+            "%d -> %d" % (old["queries"], new["queries"]),
+            "%.0f -> %.0f" % (old["peak_kib"], new["peak_kib"]),
+        ))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the /v0 routes against a seeded in-memory database.')
+    parser.add_argument('--schools', type=int, default=20)
+    parser.add_argument('--schedules', type=int, default=10, help='bell schedules per school')
+    parser.add_argument('--dates', type=int, default=180, help='dates per bell schedule')
+    parser.add_argument('--meeting-times', type=int, default=8, help='meeting times per bell schedule')
+    parser.add_argument('--rounds', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed requests per route before the timed ones')
+    parser.add_argument('--route', action='append', help='only benchmark this route (can be repeated)')
+    parser.add_argument('--response-cache', action='store_true', help='leave the response cache enabled')
+    parser.add_argument('--json', metavar='FILE', help='also write the results to this file')
+    parser.add_argument('--compare', nargs='+', metavar='REV', help='compare two git revisions, or one revision and the working tree')
+    parser.add_argument('--app-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.compare:
+        if len(args.compare) > 2:
+            parser.error("--compare takes one or two revisions")
+        compare(args.compare, args)
+    else:
+        if args.app_dir:
+            # run against another checkout of the app (see run_revision)
+            sys.path.insert(0, args.app_dir)
+        results = run(args)
+        print_results(results)
+        if args.json:
+            with open(args.json, "w") as output:
+                json.dump(results, output, indent=2)
+        # revisions that are compared are only measured, since older ones may not meet the current limits
+        problems = [] if args.app_dir else check_results(results)
+        if problems:
+            print("\n".join(problems), file=sys.stderr)
+            sys.exit(1)
@@ -0,0 +1,112 @@
+"""
+Checks the SQL statements that loading a bell schedule payload through BellScheduleSchema sends for its
+meeting times, against the same kind of seeded in-memory SQLite database as benchmarks/routes.py.
+
+- Resolving the stored meeting times of the schedule being loaded into takes exactly one SELECT,
+  however many there are (instead of one per meeting time).
+- Meeting times that refer to another schedule are not looked up, and become new rows of the schedule
+  being loaded into.
+- Creating a bell schedule through POST /v0/bellschedule with meeting times copied from another
+  school's schedule looks nothing up and leaves that schedule's meeting times where they are.
+
+The exit code is 1 if any check fails.
+
+Usage: python -m benchmarks.schema_loads
+"""
+import argparse
+import sys
+
+from benchmarks import routes
+
+
+class Args:
+    schools = 2
+    schedules = 2
+    dates = 5
+    meeting_times = 20
+
+
+def meeting_time_payload(schedule):
+    # the way they are returned by the API, including bell_schedule_id
+    return [
+        {"bell_schedule_id": m.bell_schedule_id, "name": m.name, "start_time": m.start_time.isoformat(), "end_time": m.end_time.isoformat()}
+        for m in schedule.meeting_times
+    ]
+
+
+def meeting_time_selects(statements):
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT") and "bellschedulemeetingtimes" in s]
+
+
+def run():
+    from sqlalchemy import event
+    from common.db_schema import db, School, BellSchedule
+    from common.schemas import BellScheduleSchema
+
+    app, token = routes.load_app(response_cache=False)
+    failures = []
+    with app.app_context():
+        school_id, schedule_ids = routes.seed(Args.schools, Args.schedules, Args.dates, Args.meeting_times)
+        other_school = School.query.filter(School.id != school_id).first()
+        other_schedule_id = other_school.schedules[0].id
+        own_payload = meeting_time_payload(BellSchedule.query.get(schedule_ids[0]))
+        other_payload = meeting_time_payload(other_school.schedules[0])
+
+        statements = []
+        event.listen(db.get_engine(app), "before_cursor_execute", lambda conn, cursor, statement, *_: statements.append(statement))
+
+        def resolve(schedule, payload):
+            """Deserializes meeting times into schedule and returns them, with the statements that it sent"""
+            schema = BellScheduleSchema()
+            schema.session = db.session
+            schema.instance = schedule
+            del statements[:]
+            resolved = schema.fields["meeting_times"].deserialize(payload)
+            return resolved, list(statements)
+
+        # nothing is in the identity map but the schedule itself
+        db.session.expunge_all()
+        schedule = BellSchedule.query.get(schedule_ids[0])
+        resolved, sent = resolve(schedule, own_payload)
+        if len(sent) != 1 or len(meeting_time_selects(sent)) != 1:
+            failures.append("resolving %d stored meeting times sent %d statements instead of one SELECT" % (len(own_payload), len(sent)))
+        if any(m not in db.session for m in resolved) or any(db.inspect(m).pending for m in resolved):
+            failures.append("the stored meeting times of the schedule being updated were not the ones resolved")
+
+        db.session.expunge_all()
+        schedule = BellSchedule.query.get(schedule_ids[0])
+        resolved, sent = resolve(schedule, other_payload)
+        if sent:
+            failures.append("meeting times of another schedule were looked up: %d statements" % len(sent))
+        if any(m.bell_schedule_id is not None for m in resolved):
+            failures.append("meeting times of another schedule were resolved to its rows instead of new ones")
+        db.session.rollback()
+
+    client = app.test_client()
+    body = {"school_id": school_id, "name": "Copied", "display_name": "C", "dates": [], "meeting_times": other_payload}
+    del statements[:]
+    response = client.post("/v0/bellschedule", json=body, headers={"Authorization": "Bearer " + token})
+    if response.status_code != 200:
+        failures.append("creating a bell schedule returned %d: %s" % (response.status_code, response.get_data(as_text=True)[:500]))
+    # the meeting times are read again after the INSERTs, for the response
+    inserted = next((i for i, s in enumerate(statements) if s.lstrip().upper().startswith("INSERT")), len(statements))
+    lookups = meeting_time_selects(statements[:inserted])
+    if lookups:
+        failures.append("creating a bell schedule looked up its meeting times: %d SELECTs" % len(lookups))
+    with app.app_context():
+        left = len(BellSchedule.query.get(other_schedule_id).meeting_times)
+    if left != Args.meeting_times:
+        failures.append("creating a bell schedule moved the meeting times of another school's schedule: %d of %d are left" % (left, Args.meeting_times))
+
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check the SQL statements that loading bell schedule payloads sends.')
+    parser.parse_args()
+
+    failures = run()
+    for failure in failures:
+        print(failure, file=sys.stderr)
+    print("%d checks failed" % len(failures))
+    sys.exit(1 if failures else 0)
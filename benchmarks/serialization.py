@@ -0,0 +1,93 @@
+"""
+Benchmarks serializing a large list of bell schedules the way respond() used to (a new schema instance,
+Schema.dump and json.dumps per request) against common.serialization.dump and the shared JSON encoder.
+
+The objects are built in memory, so no database is needed. The two outputs are checked to be byte-for-byte identical.
+
+Usage: python -m benchmarks.serialization [--schedules 500] [--dates 180] [--meeting-times 8] [--rounds 20]
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import time
+
+# verify tokens offline so that importing the helpers doesn't try to reach Auth0
+os.environ.setdefault("AUTH0_JWKS", '{"keys": []}')
+
+from common.db_schema import School, BellSchedule, BellScheduleDate, BellScheduleMeetingTime, get_uuid
+from common.helpers import JSONEncoder, json_encoder
+from common.schemas import BellScheduleSchema
+from common.serialization import dump
+
+EXCLUDE = ('school_id', 'soft_deleted')
+
+
+def make_schedules(count, dates, meeting_times):
+    now = datetime.datetime(2024, 1, 1, 12, 30, 15, 123456)
+    school = School(id=get_uuid(), full_name="Benchmark High School", acronym="BHS", owner_id="auth0|bench", creation_date=now, last_modified=now)
+    schedules = []
+    for i in range(count):
+        schedule = BellSchedule(
+            id=get_uuid(),
+            school=school,
+            full_name="Schedule %d" % i,
+            display_name="S%d" % i,
+            creation_date=now,
+            last_modified=now,
+            soft_deleted=False
+        )
+        schedule.dates = [BellScheduleDate(date=datetime.date(2024, 1, 1) + datetime.timedelta(days=d), creation_date=now) for d in range(dates)]
+        schedule.meeting_times = [
+            BellScheduleMeetingTime(name="Period %d" % p, start_time=datetime.time(8 + p, 0), end_time=datetime.time(8 + p, 50), creation_date=now)
+            for p in range(meeting_times)
+        ]
+        schedules.append(schedule)
+    return schedules
+
+
+def before(schedules):
+    return json.dumps({"data": BellScheduleSchema(exclude=EXCLUDE).dump(schedules, many=True)}, cls=JSONEncoder).encode()
+
+
+def after(schedules):
+    return json_encoder.encode({"data": dump(BellScheduleSchema, schedules, many=True, exclude=EXCLUDE)}).encode("ascii")
+
+
+def measure(name, func, schedules, rounds):
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        body = func(schedules)
+        samples.append(time.perf_counter() - start)
+    print("%-8s rounds=%d mean=%.2fms min=%.2fms max=%.2fms bytes=%d" % (
+        name,
+        rounds,
+        statistics.mean(samples) * 1000,
+        min(samples) * 1000,
+        max(samples) * 1000,
+        len(body)
+    ))
+    return statistics.mean(samples)
+
+
+def run(count, dates, meeting_times, rounds):
+    schedules = make_schedules(count, dates, meeting_times)
+
+    if before(schedules) != after(schedules):
+        raise AssertionError("the serialized output differs between Schema.dump and common.serialization.dump")
+
+    old = measure("before", before, schedules, rounds)
+    new = measure("after", after, schedules, rounds)
+    print("speedup: %.2fx" % (old / new))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark serializing bell schedule listings.')
+    parser.add_argument('--schedules', type=int, default=500)
+    parser.add_argument('--dates', type=int, default=180, help='dates per schedule')
+    parser.add_argument('--meeting-times', type=int, default=8, help='meeting times per schedule')
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+    run(args.schedules, args.dates, args.meeting_times, args.rounds)
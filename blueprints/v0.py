@@ -1,5 +1,5 @@
 import uuid
-import datetime
+from datetime import datetime
 from flask_limiter import util
 from flask import current_app, json
 from os import environ as env
@@ -14,12 +14,15 @@ from marshmallow.exceptions import ValidationError
 # from bson import json_util
 # from bson.objectid import ObjectId
 import http.client
-from common.db_schema import School as SchoolDB, db, BellSchedule as BellScheduleDB
-from sqlalchemy import create_engine
+from common.db_schema import School as SchoolDB, db, BellSchedule as BellScheduleDB, BellScheduleDate as BellScheduleDateDB
+from sqlalchemy import create_engine, and_, or_, func, case, select, union
+from sqlalchemy.orm import selectinload, joinedload, contains_eager, aliased
 
 from common.helpers import *
 from common.constants import APIScopes, HTTP_DATE_FORMAT
 from common.schemas import SchoolSchema, BellScheduleSchema
+from common.serialization import dump
+from common.schedule_updates import load_dates, load_meeting_times, sync_dates, sync_meeting_times
 from common.services import auth0management
 import common.exceptions
 
@@ -35,6 +38,101 @@ DB_PASSWORD = env.get("DB_PASSWORD")
 
 blueprint = Blueprint('v0', __name__)
 
+def filter_schedule_listing(schedules, exclude=()):
+    """Applies the query parameters shared by the bell schedule listing endpoints to a query for bell schedules
+
+    `from` and `to` limit the dates included with each schedule. This is done in the query, so the
+    dates outside of the window are never loaded. `include_meeting_times=false` leaves meeting
+    times out of the response (and doesn't load them). `fields` limits the response to the listed
+    fields, and only the columns and relationships behind them are loaded.
+
+    BellScheduleSchema serializes the meeting times and dates of each schedule, which would otherwise
+    be lazy loaded one schedule at a time. They are loaded with one extra query each (selectinload)
+    rather than joined, so that dates and meeting times don't multiply each other's rows.
+
+    Arguments:
+        schedules {Query} -- a query for the bell schedules to list
+
+    Keyword Arguments:
+        exclude {tuple} -- the fields that the endpoint leaves out of the response (default: {()})
+
+    Returns:
+        (Query, tuple) -- the updated query, and all of the fields to exclude when serializing its results
+    """
+    start = get_date_param('from')
+    end = get_date_param('to')
+    excluded_fields = exclude + get_fields_param(BellScheduleSchema, exclude)
+    if not get_bool_param('include_meeting_times', True):
+        excluded_fields += tuple(name for name in ('meeting_times', 'classes') if name not in excluded_fields)
+
+    if 'dates' not in excluded_fields:
+        if start is None and end is None:
+            schedules = schedules.options(selectinload(BellScheduleDB.dates))
+        else:
+            # filter the dates as part of the join so that schedules with no dates in the window are still listed
+            date_filter = [BellScheduleDateDB.bell_schedule_id == BellScheduleDB.id]
+            if start is not None:
+                date_filter.append(BellScheduleDateDB.date >= start)
+            if end is not None:
+                date_filter.append(BellScheduleDateDB.date <= end)
+            schedules = schedules.outerjoin(BellScheduleDateDB, and_(*date_filter)) \
+                .options(contains_eager(BellScheduleDB.dates))
+
+    if 'meeting_times' not in excluded_fields:
+        schedules = schedules.options(selectinload(BellScheduleDB.meeting_times))
+
+    if 'fields' in request.args:
+        schedules = schedules.options(load_only_fields(BellScheduleDB, BellScheduleSchema, excluded_fields))
+
+    return schedules, excluded_fields
+
+def school_listing_version():
+    """Returns the ResourceVersion of the list of schools, using a single aggregate query
+
+    Deleting a school removes its row, which doesn't move the latest modification time forward (and
+    can move it back), so the listing has no Last-Modified time for If-Modified-Since to be compared
+    to. It would get a 304 with the deleted school still listed. The ETag includes the number of schools.
+    """
+    visible_count, last_modified = db.session.query(
+        func.sum(case([(SchoolDB.soft_deleted == False, 1)], else_=0)),
+        func.max(SchoolDB.last_modified)
+    ).one()
+    return ResourceVersion(None, last_modified, visible_count)
+
+def schedule_listing_version(schedules, *etag_parts, with_last_modified=True):
+    """Returns the ResourceVersion of a list of bell schedules, using a single aggregate query
+
+    Arguments:
+        schedules {Query} -- a query for the schedules in the list, including soft deleted ones so that deleting one changes the version
+        etag_parts -- anything else that the contents of the list depend on
+
+    Keyword Arguments:
+        with_last_modified {bool} -- whether to send a Last-Modified time. This should be False if schedules can leave the list without being modified, see school_listing_version (default: {True})
+    """
+    visible_count, last_modified = schedules.with_entities(
+        func.sum(case([(BellScheduleDB.soft_deleted == False, 1)], else_=0)),
+        func.max(BellScheduleDB.last_modified)
+    ).one()
+    if not with_last_modified:
+        return ResourceVersion(None, last_modified, visible_count, *etag_parts)
+    return ResourceVersion(last_modified, visible_count, *etag_parts)
+
+# the largest page size for paginated listings
+MAX_PAGE_SIZE = 100
+
+# the most bell schedules that /bellschedules?ids= will fetch in one request
+MAX_BATCH_SIZE = int(env.get("MAX_BATCH_SIZE", 100))
+
+# appended to a search prefix to get the end of the range of values that start with it. It sorts after
+# every other character in the Basic Multilingual Plane
+SEARCH_RANGE_END = "\uffff"
+
+# when more than one schedule of a school has the same date, the one that was modified most recently is in effect
+SCHEDULE_PRECEDENCE = (BellScheduleDB.last_modified.desc(), BellScheduleDB.id)
+
+# the longest date range that /school/<school_id>/schedule will resolve in one request
+MAX_SCHEDULE_RANGE_DAYS = 366
+
 flex_url = "http://localhost:3000" if env.get("FLASK_ENV") == 'development' else "classclock-*-moralcode.vercel.app"
 
 
@@ -95,12 +193,37 @@ def ping():
     """
     return "pong"
 
-# TODO: add a search parameter
 @blueprint.route("/schools", strict_slashes=False, methods=['GET'])
 @check_headers
+@cache_response("schools")
 def list_schools():
     """ Returns a list of schools
     ---
+    parameters:
+        - in: query
+          name: fields
+          description: a comma separated list of the fields to include for each school (i.e. id,full_name,acronym). Only these are loaded from the database
+          schema:
+            type: string
+          required: false
+        - in: query
+          name: q
+          description: only include schools whose name or acronym starts with this text
+          schema:
+            type: string
+          required: false
+        - in: query
+          name: limit
+          description: the maximum number of schools to return (at most 100). If this or cursor is provided, the results are paginated and the response includes links.next when there are more results
+          schema:
+            type: integer
+          required: false
+        - in: query
+          name: cursor
+          description: where to continue from. This comes from the links.next URL of the previous page
+          schema:
+            type: string
+          required: false
     responses:
       200:
         description: A list of schools
@@ -110,14 +233,53 @@ def list_schools():
                     $ref: '#/definitions/School'
     """
 
-    school_list = []
-    schools = SchoolDB.query.filter_by(soft_deleted=False).all()
+    version = school_listing_version()
+    if version.is_current():
+        return version.not_modified()
+
+    exclude = ('soft_deleted',)
+    exclude += get_fields_param(SchoolSchema, exclude)
+    search = request.args.get('q')
+    if search:
+        # a range of the lowercased name and acronym rather than LIKE, so that the search is case-insensitive and
+        # can be answered from an index on every database. The two ranges are separate queries because databases
+        # tend to give up on the indexes of an OR across two columns (and read every school that isn't deleted)
+        prefix = search.lower()
+        matches = union(*[
+            select([SchoolDB.id]).where(and_(SchoolDB.soft_deleted == False, column >= prefix, column < prefix + SEARCH_RANGE_END))
+            for column in (SchoolDB.search_name, SchoolDB.search_acronym)
+        ])
+        schools = SchoolDB.query.filter(SchoolDB.id.in_(matches))
+    else:
+        schools = SchoolDB.query.filter_by(soft_deleted=False)
+
+    cursor = request.args.get('cursor')
+    limit = get_int_param('limit', None, minimum=1, maximum=MAX_PAGE_SIZE)
+    loaded_schools = schools.options(load_only_fields(SchoolDB, SchoolSchema, exclude)) if 'fields' in request.args else schools
+    if cursor is None and limit is None:
+        return version.apply(respond_with_query(schools, SchoolDB.id, SchoolSchema, exclude=exclude, loaded_query=loaded_schools))
+
+    # keyset pagination: each page continues after the id of the last school on the previous one
+    limit = limit or MAX_PAGE_SIZE
+    schools = loaded_schools.order_by(SchoolDB.id)
+    if cursor is not None:
+        if not re.fullmatch("[0-9a-fA-F]{32}", cursor):
+            raise Oops("The cursor query parameter is invalid", 400, title="Invalid Parameter")
+        schools = schools.filter(SchoolDB.id > cursor)
+
+    # fetch one extra to find out if there is another page
+    schools = schools.limit(limit + 1).all()
+    links = None
+    if len(schools) > limit:
+        schools = schools[:limit]
+        links = {"next": url_for('.list_schools', q=search, fields=request.args.get('fields'), limit=limit, cursor=schools[-1].id)}
 
-    return respond(SchoolSchema(exclude=('soft_deleted',)).dump(schools, many=True))
+    return version.apply(respond(dump(SchoolSchema, schools, many=True, exclude=exclude), links=links))
 
 
 @blueprint.route("/school/<string:school_id>", strict_slashes=False, methods=['GET'])
 @check_headers
+@cache_response("school:{school_id}")
 def get_school(school_id):
     """ Returns a single school
     ---
@@ -133,27 +295,39 @@ def get_school(school_id):
             type: string
             length: 32
           required: true
+        - in: query
+          name: fields
+          description: a comma separated list of the fields to include (i.e. id,full_name,acronym). Only these are loaded from the database
+          schema:
+            type: string
+          required: false
         - in: header
           name: If-Modified-Since
           schema:
             type: string
             format: date
           required: false
+        - in: header
+          name: If-None-Match
+          schema:
+            type: string
+          required: false
     """
 
-    school = SchoolDB.query.filter_by(id=school_id, soft_deleted=False).first()
+    exclude = ('soft_deleted',)
+    exclude += get_fields_param(SchoolSchema, exclude)
+    school = SchoolDB.query.filter_by(id=school_id, soft_deleted=False) \
+        .options(load_only_fields(SchoolDB, SchoolSchema, exclude, 'last_modified')).first()
     #double check this
     if school is None:
         raise Oops("No school was found with the specified id.",
                     404, title="Resource Not Found")
 
-    if 'If-Modified-Since' in request.headers:
-        since = datetime.strptime(request.headers.get('If-Modified-Since'), HTTP_DATE_FORMAT)
-        # TODO: make this a more robust check
-        if school.last_modified == since:
-            return respond(code=304) #Not Modified
+    version = ResourceVersion(school.last_modified, school.id)
+    if version.is_current():
+        return version.not_modified()
 
-    return respond(SchoolSchema(exclude=('soft_deleted',)).dump(school))
+    return version.apply(respond(dump(SchoolSchema, school, exclude=exclude)))
 
 
 @blueprint.route("/school", strict_slashes=False, methods=['POST'])
@@ -177,7 +351,7 @@ def create_school():
         schema:
           $ref: '#/definitions/School'
     """
-    # if len(list_owned_school_ids()) > 0:
+    # if len(owned_school_ids()) > 0:
     #     raise Oops(
     #         "Authorizing user is already the owner of another school", 401)
 
@@ -200,10 +374,11 @@ def create_school():
 
     db.session.add(new_object)
     db.session.commit()
+    invalidate_responses("schools")
 
     #TODO: need to verify that the insert worked?
 
-    return respond(SchoolSchema(exclude=('soft_deleted',)).dump(new_object))
+    return respond(dump(SchoolSchema, new_object, exclude=('soft_deleted',)))
 
 
 @blueprint.route("/school/<string:school_id>", strict_slashes=False, methods=['PATCH'])
@@ -241,13 +416,13 @@ def update_school(school_id):
         raise Oops("No records could be updated because none were found",
                     404, title="No Records Found")
     else:
-        check_ownership(school)
+        check_ownership(school.id, school.owner_id)
         
 
      # check modification times
      # this needs to happen after the school is retreived from the DB for comparison
     if 'If-Unmodified-Since' in request.headers:
-        since = datetime.datetime.strptime(request.headers.get('If-Unmodified-Since'), HTTP_DATE_FORMAT)
+        since = datetime.strptime(request.headers.get('If-Unmodified-Since'), HTTP_DATE_FORMAT)
         trap_object_modified_since(school.last_modified, since)
 
 
@@ -258,10 +433,12 @@ def update_school(school_id):
         # print(err.valid_data)
         return respond(err.messages, code=400)
 
+    changed = ("schools", "school:" + school.id)
     db.session.commit()
+    invalidate_responses(*changed)
     #TODO: need to verify that the update worked?
 
-    return respond(SchoolSchema(exclude=('soft_deleted',)).dump(school))
+    return respond(dump(SchoolSchema, school, exclude=('soft_deleted',)))
 
 
 @blueprint.route("/school/<string:school_id>", strict_slashes=False, methods=['DELETE'])
@@ -295,56 +472,178 @@ def delete_school(school_id):
         raise Oops("No records could be deleted because none were found",
                     404, title="No Records Found")
     else:
-        check_ownership(school)
+        check_ownership(school.id, school.owner_id)
 
     # check modification times
     # this needs to happen after the school is retreived from the DB for comparison
     if 'If-Unmodified-Since' in request.headers:
-        since = datetime.datetime.strptime(request.headers.get('If-Unmodified-Since'), HTTP_DATE_FORMAT)
+        since = datetime.strptime(request.headers.get('If-Unmodified-Since'), HTTP_DATE_FORMAT)
         trap_object_modified_since(school.last_modified, since)
     
+    changed = ("schools", "school:" + school.id, "schedules:" + school.id)
     db.session.delete(school)
     db.session.commit()
+    invalidate_responses(*changed)
     # should this just archive the school? or delete it and all related records?
     # sqlalchemy can be set to cascade deletes (i think).
-    return None, 204
+    return respond("success", code=204)
 
 @blueprint.route("/bellschedules", strict_slashes=False, methods=['GET'])
 @check_headers
-@requires_auth#(permissions=[APIScopes.DELETE_SCHOOL, APIScopes.DELETE_BELL_SCHEDULE])
-@requires_admin
 def list_owned_bellschedules():
     """
-    gets a list of bell schedules that are part of schools that the current user owns
+    gets a list of bell schedules that are part of schools that the current user owns, or, with the ids parameter, a list of bell schedules by id
     ---
     security:
       - ApiKeyAuth: []
+    parameters:
+        - in: query
+          name: ids
+          description: a comma separated list of the ids of up to MAX_BATCH_SIZE (100 by default) bell schedules to get, which doesn't require authentication. The schedules are listed in the order of their ids, and an id that doesn't match a bell schedule is listed with a 404 error object in place of the schedule
+          schema:
+            type: string
+          required: false
+        - in: query
+          name: fields
+          description: a comma separated list of the fields to include for each bell schedule (i.e. id,name,display_name). Only these are loaded from the database, and dates and meeting times are not queried at all unless they are included
+          schema:
+            type: string
+          required: false
+        - in: query
+          name: from
+          description: only include dates on or after this date (YYYY-MM-DD)
+          schema:
+            type: string
+            format: date
+          required: false
+        - in: query
+          name: to
+          description: only include dates on or before this date (YYYY-MM-DD)
+          schema:
+            type: string
+            format: date
+          required: false
+        - in: query
+          name: include_meeting_times
+          description: set to false to leave out the meeting times of each schedule
+          schema:
+            type: boolean
+            default: true
+          required: false
+        - in: header
+          name: If-Modified-Since
+          schema:
+            type: string
+            format: date
+          required: false
+        - in: header
+          name: If-None-Match
+          schema:
+            type: string
+          required: false
     responses:
       200:
         description: A list of bell schedules 
         schema:
           $ref: '#/definitions/BellSchedule'
     """
-    #if get_api_user_id() not in school.owner_id
+    if 'ids' in request.args:
+        return get_bellschedules_by_id(get_ids_param('ids', MAX_BATCH_SIZE))
+    return list_schedules_of_owned_schools()
 
-    schedules = BellScheduleDB.query.join(BellScheduleDB.school).filter(SchoolDB.owner_id==get_api_user_id(), SchoolDB.soft_deleted==False, BellScheduleDB.soft_deleted==False)
+@requires_auth#(permissions=[APIScopes.DELETE_SCHOOL, APIScopes.DELETE_BELL_SCHEDULE])
+@requires_admin
+def list_schedules_of_owned_schools():
+    owned_schedules = BellScheduleDB.query.join(BellScheduleDB.school).filter(SchoolDB.owner_id==get_api_user_id(), SchoolDB.soft_deleted==False)
 
-    return respond(BellScheduleSchema(exclude=('school_id','soft_deleted')).dump(schedules, many=True))
+    # schedules leave this list without being modified when their school is deleted
+    version = schedule_listing_version(owned_schedules, get_api_user_id(), with_last_modified=False)
+    if version.is_current():
+        return version.not_modified()
+
+    schedules = owned_schedules.filter(BellScheduleDB.soft_deleted==False)
+    loaded_schedules, excluded_fields = filter_schedule_listing(schedules, exclude=('school_id','soft_deleted'))
+    if 'school' not in excluded_fields:
+        loaded_schedules = loaded_schedules.options(contains_eager(BellScheduleDB.school))
+
+    return version.apply(respond_with_query(schedules, BellScheduleDB.id, BellScheduleSchema,
+        exclude=excluded_fields, loaded_query=loaded_schedules))
     
-#TODO: add filtering for return values to reduce size of response. i.e. filter dates by after today, exclude meeting times if they havent changed
+def get_bellschedules_by_id(bell_schedule_ids):
+    """Responds with the bell schedules with the given ids, which are all fetched with one query (plus one for each of their dates and meeting times)
+
+    The schedules are listed in the order of the ids, including any repeated ones. An id that doesn't match a
+    bell schedule is listed as an object with the id and a 404 error in place of the schedule.
+
+    Arguments:
+        bell_schedule_ids {list} -- the ids of the bell schedules
+    """
+    unique_ids = list(dict.fromkeys(bell_schedule_ids))
+    # soft deleted schedules are counted too, so that deleting one of them changes the version
+    version = schedule_listing_version(BellScheduleDB.query.filter(in_ids(BellScheduleDB.id, unique_ids)))
+    if version.is_current():
+        return version.not_modified()
+
+    schedules = BellScheduleDB.query.filter(in_ids(BellScheduleDB.id, unique_ids), BellScheduleDB.soft_deleted==False)
+    schedules, excluded_fields = filter_schedule_listing(schedules, exclude=('soft_deleted',))
+    if 'school' not in excluded_fields:
+        schedules = schedules.options(joinedload(BellScheduleDB.school))
+    found = {schedule.id: schedule for schedule in schedules}
+
+    not_found = make_error_object(404, title="Resource Not Found", message="No bell schedule was found with the specified id.")
+    data = []
+    for bell_schedule_id in bell_schedule_ids:
+        if bell_schedule_id in found:
+            data.append(dump(BellScheduleSchema, found[bell_schedule_id], exclude=excluded_fields))
+        else:
+            data.append({"id": bell_schedule_id, "errors": not_found})
+
+    response = respond(data)
+    # the schedules are public, unlike the rest of this endpoint
+    response.headers["Cache-Control"] = get_cache_control("v0.get_bellschedule")
+    return version.apply(response)
+
 @blueprint.route("/bellschedules/<string:school_id>", strict_slashes=False, methods=['GET'])
 @check_headers
+@cache_response("schedules:{school_id}")
 def list_bellschedules(school_id):
     """
     gets a list of bell schedules
     ---
     parameters:
+        - in: query
+          name: fields
+          description: a comma separated list of the fields to include for each bell schedule (i.e. id,name,display_name). Only these are loaded from the database, and dates and meeting times are not queried at all unless they are included
+          schema:
+            type: string
+          required: false
         - in: path
           name: school_id
           schema:
             type: string
             length: 32
           required: true
+        - in: query
+          name: from
+          description: only include dates on or after this date (YYYY-MM-DD)
+          schema:
+            type: string
+            format: date
+          required: false
+        - in: query
+          name: to
+          description: only include dates on or before this date (YYYY-MM-DD)
+          schema:
+            type: string
+            format: date
+          required: false
+        - in: query
+          name: include_meeting_times
+          description: set to false to leave out the meeting times of each schedule
+          schema:
+            type: boolean
+            default: true
+          required: false
     responses:
       200:
         description: A list of bell schedules 
@@ -353,12 +652,21 @@ def list_bellschedules(school_id):
     
     """
 
+    version = schedule_listing_version(BellScheduleDB.query.filter_by(school_id=school_id))
+    if version.is_current():
+        return version.not_modified()
+
     schedules = BellScheduleDB.query.filter_by(school_id=school_id, soft_deleted=False)
+    loaded_schedules, excluded_fields = filter_schedule_listing(schedules, exclude=('school_id',))
+    if 'school' not in excluded_fields:
+        loaded_schedules = loaded_schedules.options(joinedload(BellScheduleDB.school))
 
-    return respond(BellScheduleSchema(exclude=('school_id',)).dump(schedules, many=True))
+    return version.apply(respond_with_query(schedules, BellScheduleDB.id, BellScheduleSchema,
+        exclude=excluded_fields, loaded_query=loaded_schedules))
 
 @blueprint.route("/bellschedule/<string:bell_schedule_id>", strict_slashes=False, methods=['GET'])
 @check_headers
+@cache_response("schedule:{bell_schedule_id}")
 def get_bellschedule(bell_schedule_id):
     """
     gets a single bell schedule
@@ -370,12 +678,23 @@ def get_bellschedule(bell_schedule_id):
             type: string
             length: 32
           required: true
+        - in: query
+          name: fields
+          description: a comma separated list of the fields to include (i.e. id,name,display_name). Only these are loaded from the database, and dates and meeting times are not queried at all unless they are included
+          schema:
+            type: string
+          required: false
         - in: header
           name: If-Modified-Since
           schema:
             type: string
             format: date
           required: false
+        - in: header
+          name: If-None-Match
+          schema:
+            type: string
+          required: false
     responses:
       200:
         description: A single of bell schedule 
@@ -383,21 +702,133 @@ def get_bellschedule(bell_schedule_id):
           $ref: '#/definitions/BellSchedule'
     """
 
+    exclude = ('soft_deleted',)
+    exclude += get_fields_param(BellScheduleSchema, exclude)
     schedule = BellScheduleDB.query.filter_by(
-        id=bell_schedule_id, soft_deleted=False).first()
+        id=bell_schedule_id, soft_deleted=False) \
+        .options(load_only_fields(BellScheduleDB, BellScheduleSchema, exclude, 'last_modified'))
+    if 'school' not in exclude:
+        schedule = schedule.options(joinedload(BellScheduleDB.school))
+    # the meeting times and dates are only (lazy) loaded if they are requested and the client's copy is out of date
+    schedule = schedule.first()
 
     #double check this
     if schedule is None:
         raise Oops("No bell schedule was found with the specified id.",
                     404, title="Resource Not Found")
 
-    if 'If-Modified-Since' in request.headers:
-        since = datetime.strptime(request.headers.get('If-Modified-Since'), HTTP_DATE_FORMAT)
-        # TODO: make this a more robust check
-        if schedule.last_modified == since:
-            return respond(code=304) #Not Modified
+    version = ResourceVersion(schedule.last_modified, schedule.id)
+    if version.is_current():
+        return version.not_modified()
+
+    return version.apply(respond(dump(BellScheduleSchema, schedule, exclude=exclude)))
+
+
+@blueprint.route("/school/<string:school_id>/schedule", strict_slashes=False, methods=['GET'])
+@check_headers
+@cache_response("schedules:{school_id}")
+def get_schedule_for_date(school_id):
+    """
+    gets the bell schedule that is in effect at a school on a given date, or a map of the schedules in effect over a range of dates
+    ---
+    parameters:
+        - in: path
+          name: school_id
+          schema:
+            type: string
+            length: 32
+          required: true
+        - in: query
+          name: date
+          description: the date to get the schedule for (YYYY-MM-DD). Either this or both of from and to are required
+          schema:
+            type: string
+            format: date
+          required: false
+        - in: query
+          name: from
+          description: the first date of the range (YYYY-MM-DD)
+          schema:
+            type: string
+            format: date
+          required: false
+        - in: query
+          name: to
+          description: the last date of the range (YYYY-MM-DD), at most 366 days after from
+          schema:
+            type: string
+            format: date
+          required: false
+    responses:
+      200:
+        description: The bell schedule (without its dates) in effect on the given date, or for a range, an object mapping each date that has a schedule to the id of that schedule. If more than one schedule has a date, the one that was modified most recently is in effect
+        schema:
+          $ref: '#/definitions/BellSchedule'
+      404:
+        description: No bell schedule is in effect on the given date
+    """
+    if 'date' not in request.args:
+        start = get_date_param('from', required=True)
+        end = get_date_param('to', required=True)
+        if end < start:
+            raise Oops("The to date must not be before the from date", 400, title="Invalid Parameter")
+        if (end - start).days >= MAX_SCHEDULE_RANGE_DAYS:
+            raise Oops("Date ranges can be at most " + str(MAX_SCHEDULE_RANGE_DAYS) + " days long", 400, title="Invalid Parameter")
+
+        version = schedule_listing_version(BellScheduleDB.query.filter_by(school_id=school_id))
+        if version.is_current():
+            return version.not_modified()
+
+        schedule_dates = db.session.query(BellScheduleDateDB.date, BellScheduleDateDB.bell_schedule_id) \
+            .join(BellScheduleDateDB.bellSchedule) \
+            .filter(
+                BellScheduleDB.school_id == school_id,
+                BellScheduleDB.soft_deleted == False,
+                BellScheduleDateDB.date >= start,
+                BellScheduleDateDB.date <= end
+            ) \
+            .order_by(BellScheduleDateDB.date, *SCHEDULE_PRECEDENCE)
+
+        schedule_map = {}
+        for schedule_date, schedule_id in schedule_dates:
+            # the first schedule for each date takes precedence
+            schedule_map.setdefault(schedule_date.isoformat(), schedule_id)
+        return version.apply(respond(schedule_map))
+
+    schedule_date = get_date_param('date')
+
+    # the schedules of the school that have the date, their meeting times and the version of the school's schedules
+    # are all read with one statement, which finds the schedules with the index on (date, bell_schedule_id)
+    school_schedules = aliased(BellScheduleDB)
+    visible_count = select([func.sum(case([(school_schedules.soft_deleted == False, 1)], else_=0))]) \
+        .where(school_schedules.school_id == school_id).as_scalar()
+    last_modified = select([func.max(school_schedules.last_modified)]) \
+        .where(school_schedules.school_id == school_id).as_scalar()
+    rows = db.session.query(BellScheduleDB, visible_count, last_modified) \
+        .select_from(BellScheduleDateDB) \
+        .join(BellScheduleDateDB.bellSchedule) \
+        .outerjoin(BellScheduleDB.meeting_times) \
+        .filter(
+            BellScheduleDateDB.date == schedule_date,
+            BellScheduleDateDB.bell_schedule_id.in_(
+                select([school_schedules.id]).where(and_(school_schedules.school_id == school_id, school_schedules.soft_deleted == False))
+            )
+        ) \
+        .options(contains_eager(BellScheduleDB.meeting_times)) \
+        .order_by(*SCHEDULE_PRECEDENCE) \
+        .all()
+
+    if not rows:
+        raise Oops("No bell schedule was found for the specified school and date.",
+                    404, title="Resource Not Found")
+
+    schedule, visible_count, last_modified = rows[0]
+    # the same as schedule_listing_version, so that this changes whenever any of the school's schedules do
+    version = ResourceVersion(last_modified, visible_count)
+    if version.is_current():
+        return version.not_modified()
 
-    return respond(BellScheduleSchema(exclude=('soft_deleted',)).dump(schedule))
+    return version.apply(respond(dump(BellScheduleSchema, schedule, exclude=('dates', 'school', 'soft_deleted'))))
 
 
 @blueprint.route("/bellschedule", strict_slashes=False, methods=['POST'])
@@ -418,18 +849,22 @@ def create_bellschedule():
           required: true
     """
     request_data = get_request_body(request)
-    school_id= request_data["school_id"]
-    # get school_id from a data parameter
-    school = SchoolDB.query.filter_by(id=school_id).first()
-    check_ownership(school)
+    school_id = request_data.get("school_id")
+    if not isinstance(school_id, str):
+        raise Oops("The school_id of the bell schedule must be provided", 400, title="Invalid Parameter")
+    # ids from the database are lowercase, but the ones that clients send might not be
+    school_id = school_id.lower()
+    check_ownership(school_id)
 
     new_schedule = BellScheduleSchema().load(request_data, session=db.session)
+    new_schedule.school_id = school_id
+    db.session.add(new_schedule)
 
-    school.schedules.append(new_schedule)
-
+    changed = ("schedules:" + school_id,)
     db.session.commit()
+    invalidate_responses(*changed)
 
-    return respond(BellScheduleSchema(exclude=('school_id','soft_deleted')).dump(new_schedule))
+    return respond(dump(BellScheduleSchema, new_schedule, exclude=('school_id','soft_deleted')))
 
 
 @blueprint.route("/bellschedule/<string:bell_schedule_id>", strict_slashes=False, methods=['PATCH'])
@@ -462,31 +897,56 @@ def update_bellschedule(bell_schedule_id):
           required: false
     """
 
-    schedule = BellScheduleDB.query.filter_by(id=bell_schedule_id).first()
-    school = SchoolDB.query.filter_by(id=schedule.school_id).first()
-    if school is not None:
-        check_ownership(school)
+    # the school is loaded with the schedule to check who owns it
+    schedule = BellScheduleDB.query.join(BellScheduleDB.school) \
+        .filter(BellScheduleDB.id == bell_schedule_id, SchoolDB.soft_deleted == False) \
+        .options(contains_eager(BellScheduleDB.school)).first()
+    if schedule is None:
+        raise Oops("No records could be updated because none were found",
+                    404, title="No Records Found")
+    check_ownership(schedule.school_id, schedule.school.owner_id)
 
     if 'If-Unmodified-Since' in request.headers:
-        since = datetime.datetime.strptime(request.headers.get('If-Unmodified-Since'), HTTP_DATE_FORMAT)
-        trap_object_modified_since(school.last_modified, since)
+        since = datetime.strptime(request.headers.get('If-Unmodified-Since'), HTTP_DATE_FORMAT)
+        trap_object_modified_since(schedule.last_modified, since)
 
     data = get_request_body(request)
     # remove ID from request body if provided because for some reason, the exclude parameter isnt working or may not be correctly getting passed down to the nested/plucked fields
     if data['id']:
         del data['id']
 
+    # dates and meeting times are compared to the stored ones so that only the rows that changed are written
+    dates = data.pop('dates', None)
+    meeting_times = data.pop('meeting_times', None)
+
     try:
+        if dates is not None:
+            dates = load_dates(dates)
+        if meeting_times is not None:
+            meeting_times = load_meeting_times(meeting_times)
         updated_schedule = BellScheduleSchema(exclude=('id', 'creation_date')).load(
             data, session=db.session, instance=schedule)
     except ValidationError as err:
         # print(err.messages)  # => {"email": ['"foo" is not a valid email address.']}
         # print(err.valid_data)
         return respond(err.messages, code=400)
-        
+
+    # without autoflush, the changes to the schedule's own columns are written once, on commit,
+    # instead of before the stored dates are read and again for last_modified
+    with db.session.no_autoflush:
+        dates_changed = dates is not None and sync_dates(schedule.id, dates)
+        meeting_times_changed = meeting_times is not None and sync_meeting_times(schedule.id, meeting_times)
+    db.session.expire(schedule, ['dates', 'meeting_times'])
+
+    if dates_changed or meeting_times_changed:
+        # changes to only the dates or meeting times don't update the schedule's row by themselves,
+        # but they still need to change its Last-Modified/ETag
+        schedule.last_modified = datetime.utcnow()
+    changed = ("schedule:" + schedule.id, "schedules:" + schedule.school_id)
     db.session.commit()
+    invalidate_responses(*changed)
 
-    return respond(BellScheduleSchema(exclude=('school_id','soft_deleted')).dump(schedule))
+    return respond(dump(BellScheduleSchema, schedule, exclude=('school_id','soft_deleted')))
 
 
 @blueprint.route("/bellschedule/<string:bell_schedule_id>", methods=['DELETE'])
@@ -514,18 +974,24 @@ def delete_bellschedule(bell_schedule_id):
           required: false
     """
 
-    schedule = BellScheduleDB.query.filter_by(id=bell_schedule_id, soft_deleted=False).first()
-    school = SchoolDB.query.filter_by(id=schedule.school_id).first()
-    if school is not None:
-        check_ownership(school)
+    # the school is loaded with the schedule to check who owns it
+    schedule = BellScheduleDB.query.join(BellScheduleDB.school) \
+        .filter(BellScheduleDB.id == bell_schedule_id, SchoolDB.soft_deleted == False, BellScheduleDB.soft_deleted == False) \
+        .options(contains_eager(BellScheduleDB.school)).first()
+    if schedule is None:
+        raise Oops("No records could be deleted because none were found",
+                    404, title="No Records Found")
+    check_ownership(schedule.school_id, schedule.school.owner_id)
     
     if 'If-Unmodified-Since' in request.headers:
-        since = datetime.datetime.strptime(request.headers.get('If-Unmodified-Since'), HTTP_DATE_FORMAT)
-        trap_object_modified_since(school.last_modified, since)
+        since = datetime.strptime(request.headers.get('If-Unmodified-Since'), HTTP_DATE_FORMAT)
+        trap_object_modified_since(schedule.last_modified, since)
 
     schedule.soft_deleted = True
     # db.session.delete(schedule)
+    changed = ("schedule:" + schedule.id, "schedules:" + schedule.school_id)
     db.session.commit()
+    invalidate_responses(*changed)
 
     return respond("success", code=204)
 
@@ -544,11 +1010,17 @@ def delete_bellschedule(bell_schedule_id):
 @blueprint.before_request
 def before():
     current_app.logger.info(request.method + " " + request.path)
+    invalidation_bus.start()
 
 
 @blueprint.after_request
 def after_request(response):
     response.headers['Content-Type'] = 'application/json'
+
+    if request.method == 'GET' and response.status_code in (200, 304) and 'Cache-Control' not in response.headers:
+        cache_control = get_cache_control(request.endpoint)
+        if cache_control is not None:
+            response.headers['Cache-Control'] = cache_control
     if response.status_code != 200:
       current_app.logger.info( "Handled request with HTTP status: " + str(response.status_code))
     
@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+_MISSING = object()
+
+
+class _InflightLoad:
+    """Tracks a load that is in progress so that concurrent callers can wait for its result"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ExpiringLRUCache:
+    """A thread-safe, size-bounded LRU cache whose entries can also expire at a given time.
+
+    Once the cache holds `maxsize` entries, adding another evicts the least recently used one.
+    Expired entries are dropped when they are looked up.
+    """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        """
+        Arguments:
+            maxsize {int} -- the maximum number of entries to hold
+            ttl {number} -- the default number of seconds an entry lives for, or None to only evict by size
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None, expires_at=None):
+        """Stores a value
+
+        Arguments:
+            key -- the key to store the value under
+            value -- the value to store
+
+        Keyword Arguments:
+            ttl {number} -- the number of seconds the entry lives for (default: the cache-wide ttl)
+            expires_at {number} -- a unix timestamp at which the entry expires. Takes precedence over ttl
+        """
+        if expires_at is None:
+            ttl = ttl if ttl is not None else self.ttl
+            if ttl is not None:
+                expires_at = time.time() + ttl
+
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Returns the cached value for a key, calling `loader` to produce it on a miss
+
+        Concurrent misses for the same key are coalesced so that only one of them calls `loader`;
+        the others wait for it and receive the same value (or exception). Exceptions are not cached.
+
+        Arguments:
+            key -- the key to look up
+            loader {callable} -- a function taking no arguments that produces the value
+
+        Keyword Arguments:
+            ttl -- the number of seconds the loaded value lives for, or a function that takes the
+                loaded value and returns that number, i.e. to cache "negative" results for less time
+                (default: the cache-wide ttl)
+        """
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            load = self._inflight.get(key)
+            is_leader = load is None
+            if is_leader:
+                # another load may have finished since the lookup above
+                entry = self._data.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > time.time()):
+                    return entry[0]
+                load = _InflightLoad()
+                self._inflight[key] = load
+                generation = self._generation
+
+        if not is_leader:
+            load.done.wait()
+            if load.error is not None:
+                raise load.error
+            return load.value
+
+        try:
+            load.value = loader()
+            # don't store a value that was invalidated while it was being loaded
+            if generation == self._generation:
+                self.set(key, load.value, ttl=ttl(load.value) if callable(ttl) else ttl)
+            return load.value
+        except Exception as e:
+            load.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            load.done.set()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+            self._generation += 1
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._generation += 1
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+class TaggedCache:
+    """An ExpiringLRUCache whose entries are tagged with the things they were built from, so that they can be invalidated by tag.
+
+    Invalidating a tag bumps its generation. Each entry remembers the generations of its tags from
+    when it started being built (see `snapshot`), and is treated as a miss once any of them has
+    changed. Taking the snapshot before building the value means that a value built from data
+    that changes while it is being built is never served.
+    """
+
+    def __init__(self, maxsize=512, ttl=None):
+        self._entries = ExpiringLRUCache(maxsize=maxsize, ttl=ttl)
+        self._generations = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def snapshot(self, tags):
+        """Returns the current generations of some tags, to pass to `set` once the value for them has been built"""
+        with self._lock:
+            # the None tag is bumped by clear, which invalidates everything
+            return tuple((tag, self._generations.get(tag, 0)) for tag in (None, *tags))
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is not None:
+            value, snapshot = entry
+            with self._lock:
+                is_current = all(self._generations.get(tag, 0) == generation for tag, generation in snapshot)
+            if is_current:
+                self.hits += 1
+                return value
+            self._entries.pop(key)
+
+        self.misses += 1
+        return default
+
+    def set(self, key, value, snapshot):
+        self._entries.set(key, (value, snapshot))
+
+    def invalidate(self, *tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+            self.invalidations += 1
+
+    def clear(self):
+        self.invalidate(None)
+        self._entries.clear()
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self._entries.evictions,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+            "maxsize": self._entries.maxsize,
+        }
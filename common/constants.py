@@ -6,6 +6,17 @@ API_DATATYPE_HEADER = {'Content-Type': API_DATATYPE}
 
 HTTP_DATE_FORMAT = '%a, %d %b %Y %H:%M:%S GMT'
 
+# Cache-Control header values for each endpoint. Responses carry an ETag and Last-Modified, so
+# "no-cache" lets clients keep a copy but makes them revalidate it (cheaply) before using it
+DEFAULT_CACHE_CONTROL = {
+    "v0.list_schools": "public, no-cache",
+    "v0.get_school": "public, no-cache",
+    "v0.list_bellschedules": "public, no-cache",
+    "v0.get_bellschedule": "public, no-cache",
+    "v0.get_schedule_for_date": "public, no-cache",
+    "v0.list_owned_bellschedules": "private, no-cache",
+}
+
 class AuthType(Enum):
     TOKEN = "Bearer"
     CREDENTIALS = "Basic"
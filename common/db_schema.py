@@ -7,6 +7,7 @@ import uuid
 from datetime import datetime, date
 from flask.helpers import url_for
 from sqlalchemy.sql.schema import ForeignKey
+from sqlalchemy.orm import validates
 
 db = SQLAlchemy()
 
@@ -18,6 +19,15 @@ class School(db.Model):
 		description: A School
 	"""
 	__tablename__ = "schools"
+	__table_args__ = (
+		# listing the schools that aren't deleted in id order. last_modified is included so that the version of the listing can be read from the index alone
+		db.Index('ix_schools_soft_deleted_school_id', 'soft_deleted', 'school_id', 'last_modified'),
+		# the ids of the schools that a user owns, read from the index alone
+		db.Index('ix_schools_owner_id_soft_deleted_school_id', 'owner_id', 'soft_deleted', 'school_id'),
+		# searching for schools by the start of their name or acronym
+		db.Index('ix_schools_soft_deleted_school_name_search', 'soft_deleted', 'school_name_search'),
+		db.Index('ix_schools_soft_deleted_school_acronym_search', 'soft_deleted', 'school_acronym_search'),
+	)
 	id = db.Column('school_id', HashColumn(length=32),
                         primary_key=True, default=get_uuid)
 	owner_id = db.Column('owner_id', db.VARCHAR(length=35))
@@ -25,19 +35,36 @@ class School(db.Model):
 	schedules = db.relationship("BellSchedule",backref=db.backref("school"))
 	acronym = db.Column(
 		'school_acronym', db.VARCHAR(length=75), nullable=True)
+	# lowercased copies of the name and acronym, kept up to date by set_search_columns, so that
+	# searching by prefix is a case-insensitive range scan of an index on every database
+	search_name = db.Column('school_name_search', db.VARCHAR(length=75), nullable=True)
+	search_acronym = db.Column('school_acronym_search', db.VARCHAR(length=75), nullable=True)
 	alternate_freeperiod_name = db.Column(
 		'alternate_freeperiod_name', db.VARCHAR(length=75), nullable=True)
 	creation_date = db.Column('creation_date', db.DateTime,
-                           default=datetime.utcnow())
+                           default=datetime.utcnow)
 	last_modified = db.Column('last_modified', db.DateTime,
-                           default=datetime.utcnow(), onupdate=datetime.utcnow)
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
 	soft_deleted = db.Column('soft_deleted', db.Boolean, nullable=False, default=False)
 
+	@validates('full_name', 'acronym')
+	def set_search_columns(self, key, value):
+		search_value = value.lower() if value is not None else None
+		if key == 'full_name':
+			self.search_name = search_value
+		else:
+			self.search_acronym = search_value
+		return value
+
 class BellSchedule(db.Model):
 	"""
 		description: A BellSchedule
 	"""
 	__tablename__ = "bellschedules"
+	__table_args__ = (
+		# listing the schedules of a school that aren't deleted in id order
+		db.Index('ix_bellschedules_school_id_soft_deleted', 'school_id', 'soft_deleted', 'bell_schedule_id'),
+	)
 	id = db.Column('bell_schedule_id', HashColumn(length=32),
                         primary_key=True, default=get_uuid)
 	school_id = db.Column(HashColumn(length=32), ForeignKey(School.id))
@@ -45,9 +72,9 @@ class BellSchedule(db.Model):
 	meeting_times = db.relationship("BellScheduleMeetingTime", cascade="save-update, merge,delete, delete-orphan")
 	display_name = db.Column('bell_schedule_display_name', db.VARCHAR(length=75))
 	creation_date = db.Column('creation_date', db.DateTime,
-                           default=datetime.utcnow())
+                           default=datetime.utcnow)
 	last_modified = db.Column('last_modified', db.DateTime,
-                           default=datetime.utcnow(), onupdate=datetime.utcnow)
+                           default=datetime.utcnow, onupdate=datetime.utcnow)
 	soft_deleted = db.Column('soft_deleted', db.Boolean, nullable=False, default=False)
 
 	def get_uri(self, blueprint_name):
@@ -61,13 +88,18 @@ class BellScheduleDate(db.Model):
 		description: A date during which a particular bell schedule is in effect
 	"""
 	__tablename__ = "bellscheduledates"
+	__table_args__ = (
+		# the primary key only covers lookups by schedule, this one covers finding the schedule for a date (without reading the table)
+		db.Index('ix_bellscheduledates_date_bell_schedule_id', 'date', 'bell_schedule_id'),
+	)
 	bell_schedule_id = db.Column('bell_schedule_id', HashColumn(length=32), ForeignKey(BellSchedule.id), primary_key=True)
 	# school_id = db.Column(HashColumn(length=32), ForeignKey(School.id))
 	date = db.Column('date', db.Date, primary_key=True)
 	creation_date = db.Column('creation_date', db.DateTime,
-                           default=datetime.today().isoformat())
+                           default=datetime.utcnow)
 	# This needs to be here because of he way that dates are updated. Since date entries are deleted and recreated instead of being modified, we need to also mark them for deletion when they are de-associated from the bell schedule.
 	# See: https://stackoverflow.com/a/23734727
+	# (PATCH requests don't go through this. common/schedule_updates.py only inserts and deletes the dates that changed)
 	bellSchedule = db.relationship("BellSchedule", backref=db.backref("dates",cascade="save-update, merge,delete, delete-orphan"))
 
 
@@ -77,6 +109,18 @@ class BellScheduleDate(db.Model):
     #         blueprint_name + "." + blueprint_name + "_single_school", school_id=self.identifier, _external=True)
 
 
+class ArchivedBellScheduleDate(db.Model):
+	"""
+		description: A date from a past year that a bell schedule was in effect, moved out of bellscheduledates by purgedb.py so that the API doesn't have to read past it
+	"""
+	__tablename__ = "bellscheduledates_archive"
+	bell_schedule_id = db.Column('bell_schedule_id', HashColumn(length=32), primary_key=True)
+	date = db.Column('date', db.Date, primary_key=True)
+	creation_date = db.Column('creation_date', db.DateTime)
+	archived_date = db.Column('archived_date', db.DateTime,
+                           default=datetime.utcnow)
+
+
 class BellScheduleMeetingTime(db.Model):
 	"""
 		description: A meeting time for a particular bell schedule (aka a class period)
@@ -93,7 +137,7 @@ class BellScheduleMeetingTime(db.Model):
                       default=datetime.now().time(),
                       primary_key=True)
 	creation_date = db.Column('creation_date', db.DateTime,
-                           default=datetime.now().isoformat())
+                           default=datetime.utcnow)
 
 	# def get_uri(self, blueprint_name):
 	#         # here the second time blueprint_name is called, it is acting like the api version number
@@ -1,37 +1,103 @@
 from __future__ import absolute_import
 import uuid
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy import types, func
+from sqlalchemy import types, func, false
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Grouping
+
+
+def hash_to_bytes(value):
+    """Converts an ID (a 32 character hex string, or a uuid.UUID) to its 16 raw bytes
+
+    Raises:
+        ValueError: if the value isn't a valid ID
+    """
+    if isinstance(value, str) and len(value) == 32:
+        # much cheaper than going through uuid.UUID. fromhex skips spaces, so check the length of the result too
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            raw = None
+        if raw is not None and len(raw) == 16:
+            return raw
+    elif isinstance(value, uuid.UUID):
+        return value.bytes
+    elif isinstance(value, (bytes, bytearray)) and len(value) == 16:
+        return bytes(value)
+    # anything else that uuid.UUID accepts, i.e. the hyphenated form
+    return uuid.UUID(value).bytes
+
 
 #https://docs.sqlalchemy.org/en/13/core/custom_types.html#backend-agnostic-guid-type
 class HashColumn(types.TypeDecorator):
+    """An ID that the app handles as a 32 character lowercase hex string
+
+    It is stored as a native UUID on PostgreSQL and as 16 raw bytes on every other database.
+    """
     impl=types.CHAR
 
     def load_dialect_impl(self, dialect):
         if dialect.name == 'postgresql':
-            return dialect.type_descriptor(UUID())
+            return dialect.type_descriptor(UUID(as_uuid=False))
         else:
             return dialect.type_descriptor(types.BINARY(16))
 
-
     def process_bind_param(self, value, dialect):
         if value is None:
             return value
         elif dialect.name == 'postgresql':
-            return uuid.UUID(value).bytes
+            # postgres parses the hex form (with or without hyphens) itself
+            return value if isinstance(value, str) else uuid.UUID(bytes=hash_to_bytes(value)).hex
         else:
-            if not isinstance(value, uuid.UUID):
-                return uuid.UUID(value).bytes
-            else:
-                # bytes
-                return value.bytes
+            return hash_to_bytes(value)
 
     def process_result_value(self, value, dialect):
         if value is None:
             return value
+        elif dialect.name == 'postgresql':
+            # psycopg2 returns the hyphenated form, or a uuid.UUID if its UUID adapter is registered
+            return value.hex if isinstance(value, uuid.UUID) else value.replace("-", "")
+        else:
+            return value.hex()
+
+    def literal_processor(self, dialect):
+        """Renders IDs straight into SQL (i.e. for in_ids). The values are always converted to bytes first, so nothing but hex digits can end up in the statement"""
+        if dialect.name == 'postgresql':
+            return lambda value: "'%s'" % hash_to_bytes(value).hex()
         else:
-            return uuid.UUID(bytes=value).hex
-        
+            return lambda value: "X'%s'" % hash_to_bytes(value).hex()
+
     # This is a shallow copy and is provided to fulfill part of the TypeEngine contract. It usually does not need to be overridden unless the user-defined TypeDecorator has local state that should be deep-copied.
     # def copy(self, **kw):
-    #     return HashColumn(32)
\ No newline at end of file
+    #     return HashColumn(32)
+
+
+class _LiteralList(ClauseElement):
+    def __init__(self, values, type_):
+        self.values = values
+        self.type = type_
+
+
+@compiles(_LiteralList)
+def _compile_literal_list(element, compiler, **kw):
+    return ", ".join(compiler.render_literal_value(value, element.type) for value in element.values)
+
+
+def in_ids(column, ids):
+    """Builds `column IN (...)` for a list of IDs
+
+    For HashColumn columns the IDs are written into the statement as literals, instead of being
+    bound as one parameter each, which is much cheaper for long lists (i.e. a chunk of a streamed listing).
+
+    Arguments:
+        column -- the column to compare
+        ids {list} -- the IDs to look for
+
+    Returns:
+        the SQL expression
+    """
+    if not ids:
+        return false()
+    if not isinstance(column.type, HashColumn):
+        return column.in_(ids)
+    return column.op("IN")(Grouping(_LiteralList(list(ids), column.type)))
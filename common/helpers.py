@@ -1,37 +1,221 @@
-from flask import _request_ctx_stack, request, url_for, make_response, jsonify, current_app
+from flask import _request_ctx_stack, request, url_for, make_response, jsonify, current_app, stream_with_context, g, has_request_context
 from werkzeug.wrappers import Response
 from functools import wraps
 from jose import jwt
-from six.moves.urllib.request import urlopen
 import base64
+import hashlib
+import hmac
+import logging
 from os import environ as env
 import json
 from uuid import UUID, uuid4
-from datetime import datetime, time
+from datetime import datetime, time, timezone
+from time import perf_counter
 from common.services import auth0management
+from common.services.jwks import JWKSCache, StaticJWKS
+from common.services.invalidation import InvalidationBus, transport_from_url
+from common.services import metrics
 import flask_limiter
 import re
 
 import marshmallow
 import marshmallow_sqlalchemy
 
-from common.constants import AuthType, API_DATATYPE_HEADER, API_DATATYPE
-from common.db_schema import db
+from common.constants import AuthType, API_DATATYPE_HEADER, API_DATATYPE, DEFAULT_CACHE_CONTROL
+from common.db_schema import db, School
+from common.guid import in_ids
+from common.cache import ExpiringLRUCache, TaggedCache
+from common import serialization
+from common.serialization import dump, get_schema
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import load_only
 
 from common.exceptions import Oops, AuthError
 
 AUTH0_DOMAIN = env.get("AUTH0_DOMAIN")
 API_IDENTIFIER = env.get("API_IDENTIFIER")
+# a namespaced custom claim (i.e. "https://classclock.app/roles") containing the names of the user's roles
+AUTH0_ROLES_CLAIM = env.get("AUTH0_ROLES_CLAIM")
+# the iss claim that access tokens have to have. Offline mode may not have an AUTH0_DOMAIN to build it from
+AUTH0_ISSUER = env.get("AUTH0_ISSUER") or ("https://" + AUTH0_DOMAIN + "/" if AUTH0_DOMAIN else None)
 ALGORITHMS = ["RS256"]
 
-try: 
-    #TODO: remove dependency on setting up auth0 to test the API
-    management_API = auth0management.Auth0ManagementService()
-except Exception as e:
-    current_app.logger.error(e)
-    #TODO: need to implement better logging.
-    current_app.logger.warning('Auth0 is not configured correctly. Access control for requests will not be enforced.')
+CACHE_CONTROL = {**DEFAULT_CACHE_CONTROL, **json.loads(env.get("CACHE_CONTROL", "{}"))}
+
+# when signing keys are provided locally, tokens are verified without making any calls to Auth0
+offline_jwks = StaticJWKS.from_env()
+
+if offline_jwks is not None:
     management_API = None
+    jwks_cache = offline_jwks
+    if AUTH0_ROLES_CLAIM is None:
+        logging.warning("Offline mode is enabled (AUTH0_JWKS_FILE or AUTH0_JWKS) without AUTH0_ROLES_CLAIM, so no user can pass an admin role check.")
+    if AUTH0_ISSUER is None:
+        logging.warning("Offline mode is enabled (AUTH0_JWKS_FILE or AUTH0_JWKS) without AUTH0_ISSUER or AUTH0_DOMAIN, so no token can be verified.")
+else:
+    try: 
+        #TODO: remove dependency on setting up auth0 to test the API
+        management_API = auth0management.Auth0ManagementService()
+    except Exception as e:
+        current_app.logger.error(e)
+        #TODO: need to implement better logging.
+        current_app.logger.warning('Auth0 is not configured correctly. Access control for requests will not be enforced.')
+        management_API = None
+
+    jwks_cache = JWKSCache("https://"+AUTH0_DOMAIN+"/.well-known/jwks.json") if AUTH0_DOMAIN else None
+
+# listings with more objects than this are streamed this many at a time, see respond_with_query
+STREAM_CHUNK_SIZE = int(env.get("STREAM_CHUNK_SIZE", 500))
+
+verified_token_cache = ExpiringLRUCache(maxsize=int(env.get("TOKEN_CACHE_SIZE", 1024)), ttl=int(env.get("TOKEN_CACHE_TTL", 300)))
+
+# serialized responses of the public read endpoints, see cache_response
+RESPONSE_CACHE_SIZE = int(env.get("RESPONSE_CACHE_SIZE", 512))
+response_cache = TaggedCache(maxsize=RESPONSE_CACHE_SIZE, ttl=int(env.get("RESPONSE_CACHE_TTL", 300)))
+
+ROLE_CACHE_TTL = int(env.get("ROLE_CACHE_TTL", 300))
+# users with no roles are cached for a shorter time so that newly granted roles take effect quickly
+ROLE_CACHE_NEGATIVE_TTL = int(env.get("ROLE_CACHE_NEGATIVE_TTL", 30))
+role_cache = ExpiringLRUCache(maxsize=int(env.get("ROLE_CACHE_SIZE", 1024)), ttl=ROLE_CACHE_TTL)
+
+# tells the other workers (and machines) running the API to drop the cache entries that a change made stale
+invalidation_bus = InvalidationBus(transport_from_url(env.get("INVALIDATION_BUS_URL")))
+
+def _drop_responses(tags):
+    if tags is None:
+        response_cache.clear()
+    else:
+        response_cache.invalidate(*tags)
+
+def _drop_roles(user_ids):
+    if user_ids is None:
+        role_cache.clear()
+    else:
+        for user_id in user_ids:
+            role_cache.pop(user_id)
+
+invalidation_bus.subscribe("responses", _drop_responses)
+invalidation_bus.subscribe("roles", _drop_roles)
+
+# scrapes of /metrics have to send this as a bearer token when it is set, see init_metrics
+METRICS_TOKEN = env.get("METRICS_TOKEN")
+
+
+class RequestMetrics:
+    """What the current request has spent its time on so far, see init_metrics"""
+    __slots__ = ("started", "status", "sql_statements", "sql_seconds", "serialization_seconds")
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.status = None
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+
+def current_request_metrics():
+    """Returns the RequestMetrics of the current request, or None outside of a request or if metrics aren't recorded"""
+    return g.get("request_metrics") if has_request_context() else None
+
+
+def init_metrics(app):
+    """Records the latency, SQL statements and serialization time of every request to an app, and serves them (with the stats of the caches) at /metrics in the Prometheus text format
+
+    This should be called before anything else registers a before_request function, so that requests that are rejected early (i.e. rate limited) are counted too.
+    """
+    app.before_request(_start_request_metrics)
+    app.after_request(_record_response_status)
+    app.teardown_request(_finish_request_metrics)
+    app.add_url_rule("/metrics", "metrics", metrics_endpoint)
+
+    serialization.dump_timer = _time_dump
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def metrics_endpoint():
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("Authorization", "").encode(), ("Bearer " + METRICS_TOKEN).encode()):
+        return current_app.response_class("Unauthorized\n", status=401, content_type="text/plain; charset=utf-8")
+    return current_app.response_class(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _start_request_metrics():
+    metrics.registry.start()
+    g.request_metrics = RequestMetrics()
+    metrics.REQUESTS_IN_PROGRESS.inc()
+
+
+def _record_response_status(response):
+    request_metrics = current_request_metrics()
+    if request_metrics is not None:
+        request_metrics.status = response.status_code
+    return response
+
+
+def _finish_request_metrics(exception):
+    # streamed responses only get here once the whole response has been sent
+    request_metrics = g.pop("request_metrics", None)
+    if request_metrics is None:
+        return
+    metrics.REQUESTS_IN_PROGRESS.dec()
+
+    endpoint = request.endpoint or "unmatched"
+    # after_request isn't called for unhandled exceptions
+    status = request_metrics.status if request_metrics.status is not None else 500
+    metrics.REQUESTS.inc((endpoint, request.method, str(status)))
+    metrics.REQUEST_SECONDS.observe(perf_counter() - request_metrics.started, (endpoint, request.method))
+    metrics.SQL_STATEMENTS.observe(request_metrics.sql_statements, (endpoint,))
+    metrics.SQL_SECONDS.observe(request_metrics.sql_seconds, (endpoint,))
+    metrics.SERIALIZATION_SECONDS.observe(request_metrics.serialization_seconds, (endpoint,))
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["metrics_started"] = perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    request_metrics = current_request_metrics()
+    if request_metrics is not None:
+        request_metrics.sql_statements += 1
+        request_metrics.sql_seconds += perf_counter() - conn.info.pop("metrics_started", perf_counter())
+
+
+def _time_dump():
+    request_metrics = current_request_metrics()
+    if request_metrics is None:
+        return None
+    started, sql_seconds = perf_counter(), request_metrics.sql_seconds
+
+    def done():
+        # dumping a query runs it, and relationships may be loaded along the way. That is counted as SQL time instead
+        request_metrics.serialization_seconds += perf_counter() - started - (request_metrics.sql_seconds - sql_seconds)
+    return done
+
+
+def _record_serialization(started):
+    request_metrics = current_request_metrics()
+    if request_metrics is not None:
+        request_metrics.serialization_seconds += perf_counter() - started
+
+
+def _collect_cache_stats():
+    caches = {"responses": response_cache, "tokens": verified_token_cache, "roles": role_cache, "jwks": jwks_cache}
+    for name, cache in caches.items():
+        if cache is None:
+            continue
+        stats = cache.stats()
+        metrics.CACHE_HITS.set((name,), stats["hits"])
+        metrics.CACHE_MISSES.set((name,), stats["misses"])
+        if "evictions" in stats:
+            metrics.CACHE_EVICTIONS.set((name,), stats["evictions"])
+        metrics.CACHE_ENTRIES.set((name,), stats["size"] if "size" in stats else stats["keys"])
+
+    for name, count in invalidation_bus.stats().items():
+        metrics.INVALIDATION_EVENTS.set((name,), count)
+
+metrics.registry.add_collector(_collect_cache_stats)
 
 
 class JSONEncoder(json.JSONEncoder):
@@ -45,6 +229,9 @@ class JSONEncoder(json.JSONEncoder):
             return obj.decode()
         return json.JSONEncoder.default(self, obj)
 
+# encoders are stateless once created, so one is shared by every response
+json_encoder = JSONEncoder()
+
 
 # status code helpers taken from https://github.com/flask-api/flask-api/blob/master/flask_api/status.py
 def is_informational(code):
@@ -123,7 +310,7 @@ def make_error_object(code, error_id=None, title=None, message=None):
     return error_data
 
 
-def respond(response_data=None, code=200, headers=API_DATATYPE_HEADER):
+def respond(response_data=None, code=200, headers=API_DATATYPE_HEADER, links=None):
     """ Forms the data into a JSON response
 
     Arguments:
@@ -132,6 +319,7 @@ def respond(response_data=None, code=200, headers=API_DATATYPE_HEADER):
     Keyword Arguments:
         code {number} -- The optional HTTP status code to return with the response (used for errors) (default: {None})
         headers {dict} -- A dict of optional headers to add to the response
+        links {dict} -- Optional links to related pages of results (i.e. {"next": url}) to add to the JSON response (default: {None})
 
     Returns:
         A flask Response object for the web server
@@ -145,11 +333,153 @@ def respond(response_data=None, code=200, headers=API_DATATYPE_HEADER):
     else:
         content["data"] = response_data
 
+    if links:
+        content["links"] = links
+
+    # the output is ASCII (ensure_ascii is on), so it can be handed to flask as bytes without another encoding pass
+    started = perf_counter()
+    body = json_encoder.encode(content).encode("ascii")
+    _record_serialization(started)
+
     #TODO: handle if response_data is none (i.e. in case of 304 not modified)
     if code is None:
-        return make_response(json.dumps(content, cls=JSONEncoder), headers)
+        return make_response(body, headers)
     else:
-        return make_response(json.dumps(content, cls=JSONEncoder), code, headers)
+        return make_response(body, code, headers)
+
+
+def respond_stream(chunks, headers=API_DATATYPE_HEADER, links=None):
+    """ Forms a list of items into a JSON response that is sent as it is generated
+
+    The output is the same as respond(list_of_all_items, links=links).
+
+    Arguments:
+        chunks {iterable} -- lists of JSON-serializable items. These are only serialized as the response is sent, so they can be generated lazily
+
+    Keyword Arguments:
+        headers {dict} -- A dict of optional headers to add to the response
+        links {dict} -- Optional links to related pages of results to add to the JSON response (default: {None})
+
+    Returns:
+        A streamed flask Response object for the web server
+    """
+    def generate():
+        yield '{"data": ['
+        separator = ""
+        for chunk in chunks:
+            if chunk:
+                started = perf_counter()
+                encoded = ", ".join(json_encoder.encode(item) for item in chunk)
+                _record_serialization(started)
+                yield separator + encoded
+                separator = ", "
+        yield "]"
+        if links:
+            yield ', "links": ' + json_encoder.encode(links)
+        yield "}"
+
+    # keep the request (and database session) around until the whole response has been sent
+    return current_app.response_class(stream_with_context(generate()), status=200, headers=headers)
+
+
+def respond_with_query(query, id_column, schema_class, exclude=(), loaded_query=None):
+    """ Responds with every object matched by a query, ordered by id
+
+    Up to STREAM_CHUNK_SIZE objects are loaded and sent at once like respond does, with one query.
+    Bigger results are streamed: the objects are loaded, serialized and sent STREAM_CHUNK_SIZE at a
+    time (using keyset pagination on the ids) so that memory use doesn't grow with the number of
+    objects. Either way the output is the same.
+
+    Arguments:
+        query -- the query for the objects
+        id_column -- the primary key column to order and split up the results by
+        schema_class {type} -- the schema to serialize the objects with
+
+    Keyword Arguments:
+        exclude {tuple} -- the names of the fields to leave out (default: {()})
+        loaded_query -- the same query with eager loading options, used to load the objects (default: query)
+
+    Returns:
+        A flask Response object for the web server
+    """
+    loaded_query = (loaded_query if loaded_query is not None else query).order_by(id_column)
+
+    def load(after=None, limit=STREAM_CHUNK_SIZE):
+        page = loaded_query if after is None else loaded_query.filter(id_column > after)
+        return page.limit(limit).all()
+
+    # one more than a chunk, to find out if there are more after it
+    objects = load(limit=STREAM_CHUNK_SIZE + 1)
+    if len(objects) <= STREAM_CHUNK_SIZE:
+        return respond(dump(schema_class, objects, many=True, exclude=exclude))
+
+    def chunks(loaded):
+        while True:
+            yield dump(schema_class, loaded[:STREAM_CHUNK_SIZE], many=True, exclude=exclude)
+            if len(loaded) <= STREAM_CHUNK_SIZE:
+                break
+            # the object after the chunk has already been loaded, and starts the next one
+            first = loaded[STREAM_CHUNK_SIZE]
+            loaded = [first] + load(after=getattr(first, id_column.key))
+
+    return respond_stream(chunks(objects))
+
+
+class ResourceVersion:
+    """The validators (ETag and Last-Modified) for the current state of a requested resource
+
+    These should be computed from a cheap query (i.e. for the modification time of the rows behind the
+    response) so that a request from a client that is already up to date can be answered with a
+    304 Not Modified before the full response is loaded and serialized.
+    """
+
+    def __init__(self, last_modified, *etag_parts):
+        """
+        Arguments:
+            last_modified {datetime} -- when the resource was last modified (naive, in UTC), or None if unknown
+            etag_parts -- values that together change whenever the response would. The request path and query string are always included
+        """
+        # HTTP dates only have a precision of seconds, but the ETag can use the full precision
+        self.last_modified = last_modified.replace(microsecond=0) if last_modified is not None else None
+        fingerprint = repr((request.path, request.query_string, last_modified) + etag_parts)
+        self.etag = hashlib.sha1(fingerprint.encode()).hexdigest()
+
+    def is_current(self):
+        """Determines whether the client already has this version of the resource, based on the If-None-Match and If-Modified-Since headers
+
+        If-Modified-Since is ignored if If-None-Match is provided, as per RFC 7232
+        """
+        if request.if_none_match:
+            return request.if_none_match.contains_weak(self.etag)
+
+        since = request.if_modified_since
+        if since is not None and self.last_modified is not None:
+            return self.last_modified.replace(tzinfo=timezone.utc) <= since
+        return False
+
+    def apply(self, response):
+        """Adds the validators to a response
+
+        Returns:
+            the response
+        """
+        response.set_etag(self.etag)
+        if self.last_modified is not None:
+            response.last_modified = self.last_modified.replace(tzinfo=timezone.utc)
+        return response
+
+    def not_modified(self):
+        """Returns a 304 Not Modified response with the validators"""
+        return self.apply(make_response("", 304))
+
+
+def get_cache_control(endpoint):
+    """Returns the Cache-Control header value configured for an endpoint, or None if there isn't one
+
+    Defaults for each endpoint are in DEFAULT_CACHE_CONTROL and can be overridden with the
+    CACHE_CONTROL environment variable, a JSON object mapping endpoint names to header values
+    """
+    return CACHE_CONTROL.get(endpoint)
 
 
 def trap_object_modified_since(obj_last_modification, since):
@@ -171,6 +501,162 @@ def trap_object_modified_since(obj_last_modification, since):
         raise Oops("The resource you are trying to change has been modified elsewhere", 412, title="Resource has been Modified")
 
 
+def get_date_param(name, required=False):
+    """Parses an ISO 8601 (YYYY-MM-DD) date from a query string parameter
+
+    Arguments:
+        name {string} -- the name of the query string parameter
+
+    Keyword Arguments:
+        required {bool} -- whether to raise an error if the parameter is missing (default: {False})
+
+    Raises:
+        Oops: if the parameter is malformed, or missing when it is required
+
+    Returns:
+        date -- the parsed date, or None if the parameter is not present
+    """
+    value = request.args.get(name)
+    if value is None:
+        if required:
+            raise Oops("The " + name + " query parameter is required", 400, title="Missing Parameter")
+        return None
+
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise Oops("The " + name + " query parameter must be a date in the format YYYY-MM-DD", 400, title="Invalid Parameter")
+
+
+def get_int_param(name, default, minimum=None, maximum=None):
+    """Parses an integer from a query string parameter
+
+    Arguments:
+        name {string} -- the name of the query string parameter
+        default {int} -- the value to use if the parameter is not present
+
+    Keyword Arguments:
+        minimum {int} -- the smallest allowed value (default: {None})
+        maximum {int} -- the largest allowed value (default: {None})
+
+    Raises:
+        Oops: if the parameter is not an integer or is out of range
+
+    Returns:
+        int -- the parsed value
+    """
+    value = request.args.get(name)
+    if value is None:
+        return default
+
+    try:
+        value = int(value)
+    except ValueError:
+        raise Oops("The " + name + " query parameter must be an integer", 400, title="Invalid Parameter")
+
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise Oops("The " + name + " query parameter must be between " + str(minimum) + " and " + str(maximum), 400, title="Invalid Parameter")
+    return value
+
+
+def get_ids_param(name, maximum):
+    """Parses a comma separated list of IDs (32 character hex strings) from a query string parameter
+
+    Arguments:
+        name {string} -- the name of the query string parameter
+        maximum {int} -- the most IDs allowed
+
+    Raises:
+        Oops: if the parameter is empty, has too many IDs, or has anything in it that isn't an ID
+
+    Returns:
+        list -- the IDs, lowercased, in the order they were given (including any duplicates)
+    """
+    ids = [value.strip().lower() for value in request.args.get(name, "").split(",") if value.strip()]
+    if not ids:
+        raise Oops("The " + name + " query parameter must list at least one id", 400, title="Invalid Parameter")
+    if len(ids) > maximum:
+        raise Oops("The " + name + " query parameter can list at most " + str(maximum) + " ids", 400, title="Invalid Parameter")
+
+    invalid = [value for value in ids if not re.fullmatch("[0-9a-f]{32}", value)]
+    if invalid:
+        raise Oops("The " + name + " query parameter has invalid ids: " + ", ".join(invalid), 400, title="Invalid Parameter")
+    return ids
+
+
+def get_bool_param(name, default):
+    """Parses a boolean ("true" or "false") from a query string parameter
+
+    Arguments:
+        name {string} -- the name of the query string parameter
+        default {bool} -- the value to use if the parameter is not present
+
+    Raises:
+        Oops: if the parameter is present but is not "true" or "false"
+
+    Returns:
+        bool -- the parsed value
+    """
+    value = request.args.get(name)
+    if value is None:
+        return default
+
+    if value.lower() not in ("true", "false"):
+        raise Oops("The " + name + " query parameter must be true or false", 400, title="Invalid Parameter")
+    return value.lower() == "true"
+
+
+def get_fields_param(schema_class, exclude=()):
+    """Parses the `fields` query string parameter, a comma separated list of the fields to include in a response (i.e. "id,name")
+
+    Arguments:
+        schema_class {type} -- the schema the response is serialized with
+
+    Keyword Arguments:
+        exclude {tuple} -- the names of the fields that are left out of the response anyway (default: {()})
+
+    Raises:
+        Oops: if the parameter contains a field that the response doesn't have
+
+    Returns:
+        tuple -- the names of the other fields of the schema, to add to the fields to exclude when serializing. Empty if the parameter is not present
+    """
+    value = request.args.get('fields')
+    if value is None:
+        return ()
+
+    schema = get_schema(schema_class, tuple(exclude))
+    # clients use the names of the fields in the output, which may differ from the names of the fields in the schema
+    names = {(field.data_key or name): name for name, field in schema.dump_fields.items()}
+    requested = set()
+    for key in value.split(','):
+        key = key.strip()
+        if not key:
+            continue
+        if key not in names:
+            raise Oops("The fields query parameter contains an unknown field: " + key, 400, title="Invalid Parameter")
+        requested.add(names[key])
+    return tuple(name for name in schema.dump_fields if name not in requested)
+
+
+def load_only_fields(model, schema_class, exclude, *required):
+    """Returns a query option that only loads the columns of a model that are needed to serialize it
+
+    Arguments:
+        model {type} -- the model being queried
+        schema_class {type} -- the schema the results are serialized with
+        exclude {tuple} -- the names of the fields that are left out when serializing
+        required -- the names of other columns that are needed, i.e. for the ETag
+
+    Returns:
+        a load_only option for the query
+    """
+    columns = model.__mapper__.column_attrs.keys()
+    needed = {field.attribute or name for name, field in get_schema(schema_class, tuple(exclude)).dump_fields.items()}
+    needed.update(required)
+    return load_only(*[column for column in columns if column in needed])
+
+
 def handle_marshmallow_errors(errors):
     error_list = []
     for property_name, property_errors in errors.items():
@@ -278,18 +764,25 @@ def check_for_roles(roles:list, accept_any=True):
         bool: true if the user has any of the roles provided, false if the user has none of them, and None if there is no currently authenticated user
     """
     user_id = get_api_user_id()
-    #TODO: make management API optional and check if it is present
-    
-    if management_API is None:
-        #TODO: need to implement better logging.
-        current_app.logger.warning("Because Auth0 is not configured correctly, access control is not being enforced. All requests to check a users role will automatically pass.")
-        return True
+
+    # roles in the (already verified) token don't need a call to the management API
+    user_role_names = get_role_names_from_token()
+
+    if user_role_names is None:
+        if management_API is None:
+            if offline_jwks is not None:
+                # there is no management API to ask for roles in offline mode, so a token without the roles claim has no roles
+                return False if user_id != "" else None
+            #TODO: need to implement better logging.
+            current_app.logger.warning("Because Auth0 is not configured correctly, access control is not being enforced. All requests to check a users role will automatically pass.")
+            return True
+
+        if user_id == "":
+            return None
+
+        user_role_names = get_role_names_for_user(user_id)
 
     if user_id != "":
-        roles_json = management_API.get_roles_for_user(user_id)
-        # current_app.logger.info(roles_json)
-        user_role_names = [r["name"].lower() for r in roles_json]
-        user_role_names = set(user_role_names)
         requested_roles = set([r.lower() for r in roles])
         
         required_threshold = 1 if accept_any else len(requested_roles) 
@@ -298,21 +791,151 @@ def check_for_roles(roles:list, accept_any=True):
     else:
         return None
 
-def check_ownership(school):
-    if get_api_user_id() not in school.owner_id:
+def get_role_names_from_token():
+    """Returns the lowercased names of the roles listed in the AUTH0_ROLES_CLAIM claim of the current user's token
+
+    The claim has to be added to access tokens by an Auth0 action or rule, i.e. from `event.authorization.roles`
+
+    Returns:
+        frozenset: the names of the user's roles, or None if roles claims are not configured or the token doesn't have the claim
+    """
+    if AUTH0_ROLES_CLAIM is None or not hasattr(_request_ctx_stack.top, 'current_user'):
+        return None
+
+    claimed_roles = _request_ctx_stack.top.current_user.get(AUTH0_ROLES_CLAIM)
+    if claimed_roles is None:
+        return None
+    elif isinstance(claimed_roles, str):
+        claimed_roles = [claimed_roles]
+
+    return frozenset(r.lower() for r in claimed_roles)
+
+def get_role_names_for_user(user_id):
+    """Returns the lowercased names of the roles a user has, as reported by the Auth0 management API
+
+    Results are cached per user for ROLE_CACHE_TTL seconds (ROLE_CACHE_NEGATIVE_TTL seconds if the
+    user has no roles), and concurrent lookups for the same user share a single management API call.
+
+    Args:
+        user_id (string): the Auth0 ID of the user
+
+    Returns:
+        frozenset: the names of the user's roles
+    """
+    def load_roles():
+        roles_json = management_API.get_roles_for_user(user_id)
+        return frozenset(r["name"].lower() for r in roles_json)
+
+    return role_cache.get_or_load(
+        user_id,
+        load_roles,
+        ttl=lambda role_names: ROLE_CACHE_TTL if role_names else ROLE_CACHE_NEGATIVE_TTL
+    )
+
+def invalidate_role_cache(user_id=None):
+    """Forgets the cached roles of a user so that changes to their roles take effect on their next request
+
+    Args:
+        user_id (string, optional): the Auth0 ID of the user. Defaults to None, which forgets the cached roles of every user.
+    """
+    invalidation_bus.publish("roles", [user_id] if user_id is not None else None)
+
+def owned_school_ids():
+    """Returns the ids of the schools (that aren't deleted) owned by the user that the current request is on behalf of
+
+    They are read with one query (from the index on owner_id) the first time this is called during a
+    request, and remembered until the end of the request. Requests that aren't on behalf of a user
+    (i.e. with a client credentials token) don't own any schools.
+
+    Returns:
+        frozenset -- the school ids
+    """
+    if "owned_school_ids" not in g:
+        user_id = get_api_user_id()
+        if not user_id:
+            g.owned_school_ids = frozenset()
+        else:
+            g.owned_school_ids = frozenset(school_id for school_id, in db.session.query(School.id).filter(
+                School.owner_id == user_id, School.soft_deleted == False))
+    return g.owned_school_ids
+
+
+def check_ownership(school_id, owner_id=None):
+    """Checks that the user that the current request is on behalf of owns a school
+
+    Arguments:
+        school_id {string} -- the id of the school
+
+    Keyword Arguments:
+        owner_id {string} -- the owner_id of the school, if it has already been loaded. Otherwise the schools that the user owns are looked up (default: {None})
+
+    Raises:
+        Oops: if the user doesn't own the school
+    """
+    if owner_id is not None:
+        user_id = get_api_user_id()
+        owned = bool(user_id) and owner_id == user_id
+    else:
+        owned = school_id in owned_school_ids()
+    if not owned:
         raise Oops("Authorizing user does not have permission to access the requested school", 401)
 
 
-def list_owned_school_ids(cursor, school_id):
-    #TODO: remove manual SQL, also this is like horrifically broken 
-    cursor.execute(
-        "SELECT UNHEX(school_id) as id FROM schools WHERE owner_id=%s", (school_id,))
-    # dict_keys_map defines the keys for the dictionary that is generated from the tuples returned from the database (so order matters)
-    # dict_keys_map = ("id", "full_name", "acronym")
+def verify_token(token):
+    """Verifies an RS256 signed JWT access token against the Auth0 signing keys
 
-    return [sch_id[0] for sch_id in cursor]
+    Tokens that have already been verified are remembered (by digest) until they expire, so repeat
+    requests with the same token skip the signature verification.
 
+    Arguments:
+        token {string} -- the encoded access token
 
+    Raises:
+        AuthError: if the token is invalid
+
+    Returns:
+        dict -- the verified token payload
+    """
+    token_digest = hashlib.sha256(token.encode()).hexdigest()
+    payload = verified_token_cache.get(token_digest)
+    if payload is not None:
+        return payload
+
+    if AUTH0_ISSUER is None:
+        # jwt.decode would accept tokens from any issuer without one
+        raise AuthError("Access tokens can't be verified because neither AUTH0_ISSUER nor AUTH0_DOMAIN is configured", 500)
+
+    try:
+        unverified_header = jwt.get_unverified_header(token)
+    except jwt.JWTError:
+        raise AuthError(
+            "Invalid token. Use an RS256 signed JWT Access Token", 401)
+    if unverified_header["alg"] == "HS256":
+        raise AuthError(
+            "Invalid token algorithm. Use an RS256 signed JWT Access Token", 401)
+    rsa_key = jwks_cache.get_key(unverified_header.get("kid"))
+    if not rsa_key:
+        raise AuthError("Unable to find appropriate key", 401)
+
+    try:
+        payload = jwt.decode(
+            token,
+            rsa_key,
+            algorithms=ALGORITHMS,
+            audience=API_IDENTIFIER,
+            issuer=AUTH0_ISSUER
+        )
+    except jwt.ExpiredSignatureError:
+        raise AuthError("Token has expired", 401)
+    except jwt.JWTClaimsError:
+        raise AuthError(
+            "Incorrect JWT claims. Please check the audience and issuer", 401)
+    except Exception:
+        raise AuthError("Unable to parse authentication token.", 401)
+
+    # tokens without an expiry fall back to the cache-wide ttl
+    verified_token_cache.set(token_digest, payload, expires_at=payload.get("exp"))
+    return payload
 
 
 #
@@ -327,60 +950,23 @@ def requires_auth(_func=None, *, permissions=None):
     def args_or_no(func):
         @wraps(func)
         def decorated(*args, **kwargs):
-            if not management_API:
+            if not management_API and offline_jwks is None:
                 #TODO: need to implement better logging.
                 current_app.logger.warning("Because Auth0 is not configured correctly, access control is not being enforced. All requests to protected endpoints will automatically succeed.")
                 return func(*args, **kwargs)
 
             token = get_token_auth_header()
-            jsonurl = urlopen("https://"+AUTH0_DOMAIN+"/.well-known/jwks.json")
-            jwks = json.loads(jsonurl.read())
-            try:
-                unverified_header = jwt.get_unverified_header(token)
-            except jwt.JWTError:
-                raise AuthError(
-                    "Invalid token. Use an RS256 signed JWT Access Token", 401)
-            if unverified_header["alg"] == "HS256":
-                raise AuthError(
-                    "Invalid token algorithm. Use an RS256 signed JWT Access Token", 401)
-            rsa_key = {}
-            for key in jwks["keys"]:
-                if key["kid"] == unverified_header["kid"]:
-                    rsa_key = {
-                        "kty": key["kty"],
-                        "kid": key["kid"],
-                        "use": key["use"],
-                        "n": key["n"],
-                        "e": key["e"]
-                    }
-            if rsa_key:
-                try:
-                    payload = jwt.decode(
-                        token,
-                        rsa_key,
-                        algorithms=ALGORITHMS,
-                        audience=API_IDENTIFIER,
-                        issuer="https://"+AUTH0_DOMAIN+"/"
-                    )
-                except jwt.ExpiredSignatureError:
-                    raise AuthError("Token has expired", 401)
-                except jwt.JWTClaimsError:
-                    raise AuthError(
-                        "Incorrect JWT claims. Please check the audience and issuer", 401)
-                except Exception:
-                    raise AuthError("Unable to parse authentication token.", 401)
-
-                _request_ctx_stack.top.current_user = payload
-
-                current_app.logger.info( "Successfully authenticated user '" + get_api_user_id() + "'" )
-
-                #this permissions check was added separately from the auth0 validation code 
-                if permissions is not None:
-                    check_permissions(payload, permissions)
+            payload = verify_token(token)
 
-                return func(*args, **kwargs)
+            _request_ctx_stack.top.current_user = payload
 
-            raise AuthError("Unable to find appropriate key", 401)
+            current_app.logger.info( "Successfully authenticated user '" + get_api_user_id() + "'" )
+
+            #this permissions check was added separately from the auth0 validation code 
+            if permissions is not None:
+                check_permissions(payload, permissions)
+
+            return func(*args, **kwargs)
         return decorated
 
     if _func is None:
@@ -407,6 +993,48 @@ def requires_admin(f):
             return f(*args, **kwargs)
     return decorated
 
+def cache_response(*tags):
+    """Caches the successful responses of a public GET endpoint in memory
+
+    Responses are cached per URL (including the query string) and are invalidated by calling
+    `invalidate_responses` with any of their tags after the data they were built from changes.
+    Cached responses still honor If-None-Match and If-Modified-Since.
+
+    Arguments:
+        tags -- format strings that are filled in with the arguments of the route (i.e. "school:{school_id}") to get the tags of each response
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or RESPONSE_CACHE_SIZE <= 0:
+                return func(*args, **kwargs)
+
+            key = request.full_path
+            cached = response_cache.get(key)
+            if cached is not None:
+                body, headers = cached
+                response = make_response(body, 200, headers)
+                return response.make_conditional(request)
+
+            # ids from the database are lowercase, but the ones in URLs might not be
+            snapshot = response_cache.snapshot([tag.format(**kwargs).lower() for tag in tags])
+            response = make_response(func(*args, **kwargs))
+            # streamed responses are too big to keep
+            if response.status_code == 200 and not response.is_streamed:
+                headers = {name: value for name, value in response.headers.items() if name in ('Content-Type', 'ETag', 'Last-Modified')}
+                response_cache.set(key, (response.get_data(), headers), snapshot)
+            return response
+        return wrapper
+    return decorator
+
+def invalidate_responses(*tags):
+    """Drops the cached responses with any of the given tags in every worker, see cache_response
+
+    Arguments:
+        tags -- the tags of the responses that are now stale, i.e. "school:" + school.id
+    """
+    invalidation_bus.publish("responses", [tag.lower() for tag in tags])
+
 # decorator modified from https://github.com/miLibris/flask-rest-jsonapi/blob/ad3f90f81955fa41aaf0fb8c49a75a5fbe334f5f/flask_rest_jsonapi/decorators.py
 def check_headers(func):
     """decorator that provides a place to check headers
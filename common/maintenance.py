@@ -0,0 +1,112 @@
+"""
+Batched clean up of rows that the API no longer serves, run by purgedb.py.
+
+Deleting a bell schedule through the API only marks it as soft deleted, and the dates of every
+schedule stay in bellscheduledates after they have passed, so every read has to filter out (and
+step over) more dead rows as time goes on. These functions remove them a batch at a time, committing
+after each batch, so that the job never holds locks on many rows at once or for long.
+"""
+from datetime import datetime
+
+from sqlalchemy import and_, or_, func
+
+from common.db_schema import db, BellSchedule, BellScheduleDate, BellScheduleMeetingTime, ArchivedBellScheduleDate
+from common.guid import in_ids
+from common.helpers import invalidate_responses
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def purge_deleted_schedules(deleted_before, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """Permanently deletes the bell schedules that were soft deleted before a time, along with their dates (including archived ones) and meeting times
+
+    Arguments:
+        deleted_before {datetime} -- schedules that were soft deleted (or last modified) before this time (naive, in UTC) are deleted
+
+    Keyword Arguments:
+        batch_size {int} -- how many schedules to delete per transaction (default: {DEFAULT_BATCH_SIZE})
+        dry_run {bool} -- only count the schedules that would be deleted (default: {False})
+
+    Returns:
+        int -- the number of schedules deleted
+    """
+    expired = db.session.query(BellSchedule.id).filter(BellSchedule.soft_deleted == True, BellSchedule.last_modified < deleted_before)
+    if dry_run:
+        return expired.count()
+
+    schedules = BellSchedule.__table__
+    # the rows that refer to a schedule have to go before it
+    dependents = (BellScheduleDate.__table__, ArchivedBellScheduleDate.__table__, BellScheduleMeetingTime.__table__)
+    purged = 0
+    while True:
+        ids = [schedule_id for schedule_id, in expired.limit(batch_size)]
+        if not ids:
+            break
+        for table in dependents:
+            db.session.execute(table.delete().where(in_ids(table.c.bell_schedule_id, ids)))
+        db.session.execute(schedules.delete().where(in_ids(schedules.c.bell_schedule_id, ids)))
+        db.session.commit()
+        purged += len(ids)
+    return purged
+
+
+def archive_dates(before, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+    """Moves the dates of bell schedules that are before a date to the archive table
+
+    The schedules that had dates archived get a new last_modified time (unless they are soft deleted),
+    and their cached responses are invalidated, because their dates are no longer listed. This only
+    reaches the API's workers through the invalidation bus, so INVALIDATION_BUS_URL has to be set.
+
+    Arguments:
+        before {date} -- dates before this one are archived
+
+    Keyword Arguments:
+        batch_size {int} -- how many dates to move per transaction (default: {DEFAULT_BATCH_SIZE})
+        dry_run {bool} -- only count the dates that would be archived (default: {False})
+
+    Returns:
+        int -- the number of dates archived
+    """
+    past_dates = db.session.query(BellScheduleDate.bell_schedule_id, BellScheduleDate.date, BellScheduleDate.creation_date) \
+        .filter(BellScheduleDate.date < before)
+    if dry_run:
+        return past_dates.with_entities(func.count()).scalar()
+
+    dates = BellScheduleDate.__table__
+    archive = ArchivedBellScheduleDate.__table__
+    schedules = BellSchedule.__table__
+    archived = 0
+    while True:
+        rows = past_dates.order_by(BellScheduleDate.date, BellScheduleDate.bell_schedule_id).limit(batch_size).all()
+        if not rows:
+            break
+
+        dates_by_schedule = {}
+        for row in rows:
+            dates_by_schedule.setdefault(row.bell_schedule_id, []).append(row.date)
+
+        def matching(table):
+            return or_(*[and_(table.c.bell_schedule_id == schedule_id, table.c.date.in_(schedule_dates))
+                for schedule_id, schedule_dates in dates_by_schedule.items()])
+
+        now = datetime.utcnow()
+        # a date that was added back after it was archived replaces the archived copy
+        db.session.execute(archive.delete().where(matching(archive)))
+        db.session.execute(archive.insert(), [
+            {"bell_schedule_id": row.bell_schedule_id, "date": row.date, "creation_date": row.creation_date, "archived_date": now}
+            for row in rows
+        ])
+        db.session.execute(dates.delete().where(matching(dates)))
+
+        schedule_ids = list(dates_by_schedule)
+        # so that clients holding the old dates see a new ETag/Last-Modified. Soft deleted schedules are left alone so that they still expire
+        db.session.execute(schedules.update()
+            .where(and_(in_ids(schedules.c.bell_schedule_id, schedule_ids), schedules.c.soft_deleted == False))
+            .values(last_modified=now))
+        school_ids = {school_id for school_id, in db.session.query(BellSchedule.school_id).filter(in_ids(BellSchedule.id, schedule_ids))}
+        db.session.commit()
+
+        invalidate_responses(*["schedule:" + schedule_id for schedule_id in schedule_ids],
+            *["schedules:" + school_id for school_id in school_ids if school_id is not None])
+        archived += len(rows)
+    return archived
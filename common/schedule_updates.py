@@ -0,0 +1,122 @@
+"""
+Updates the dates and meeting times of a bell schedule by comparing them to what is stored.
+
+Loading a whole new list of dates through BellScheduleSchema makes SQLAlchemy build an object for
+every date that is sent and work out which of them replace stored rows. These functions instead read
+just the stored keys, and only insert the rows that were added and delete the ones that were removed
+(with one statement each), so unchanged rows are never touched and keep their creation_date.
+"""
+from datetime import datetime
+
+from marshmallow import Schema, ValidationError, fields, EXCLUDE
+from sqlalchemy import and_, or_
+
+from common.db_schema import db, BellScheduleDate, BellScheduleMeetingTime
+
+
+class MeetingTimeInput(Schema):
+    class Meta:
+        # clients may send back meeting times as they were returned, including bell_schedule_id and creation_date
+        unknown = EXCLUDE
+
+    name = fields.String(required=True)
+    start_time = fields.Time(required=True)
+    end_time = fields.Time(required=True)
+
+
+_date_list = fields.List(fields.Date(), required=True)
+
+
+def load_dates(value):
+    """Validates a list of dates from a request body
+
+    Raises:
+        ValidationError: with the errors under the "dates" key, like BellScheduleSchema's
+
+    Returns:
+        set -- the dates
+    """
+    try:
+        return set(_date_list.deserialize(value))
+    except ValidationError as err:
+        raise ValidationError({"dates": err.messages})
+
+
+def load_meeting_times(value):
+    """Validates a list of meeting times (objects with a name, start_time and end_time) from a request body
+
+    Raises:
+        ValidationError: with the errors under the "meeting_times" key, like BellScheduleSchema's
+
+    Returns:
+        set -- (name, start_time, end_time) tuples, which together identify a meeting time
+    """
+    try:
+        meeting_times = MeetingTimeInput(many=True).load(value)
+    except ValidationError as err:
+        raise ValidationError({"meeting_times": err.messages})
+    return {(m["name"], m["start_time"], m["end_time"]) for m in meeting_times}
+
+
+def sync_dates(bell_schedule_id, dates):
+    """Makes the stored dates of a bell schedule match a set of dates, inserting and deleting only the ones that changed
+
+    Arguments:
+        bell_schedule_id {string} -- the id of the bell schedule
+        dates {set} -- every date that the schedule should have
+
+    Returns:
+        bool -- whether anything changed
+    """
+    table = BellScheduleDate.__table__
+    stored = {row.date for row in db.session.query(BellScheduleDate.date).filter_by(bell_schedule_id=bell_schedule_id)}
+
+    removed = stored - dates
+    if removed:
+        db.session.execute(table.delete().where(and_(
+            table.c.bell_schedule_id == bell_schedule_id,
+            table.c.date.in_(sorted(removed))
+        )))
+
+    added = dates - stored
+    if added:
+        now = datetime.utcnow()
+        db.session.execute(table.insert(), [
+            {"bell_schedule_id": bell_schedule_id, "date": date, "creation_date": now} for date in sorted(added)
+        ])
+
+    return bool(removed or added)
+
+
+def sync_meeting_times(bell_schedule_id, meeting_times):
+    """Makes the stored meeting times of a bell schedule match a set of meeting times, inserting and deleting only the ones that changed
+
+    Arguments:
+        bell_schedule_id {string} -- the id of the bell schedule
+        meeting_times {set} -- (name, start_time, end_time) tuples for every meeting time that the schedule should have
+
+    Returns:
+        bool -- whether anything changed
+    """
+    table = BellScheduleMeetingTime.__table__
+    stored = set(db.session.query(
+        BellScheduleMeetingTime.name, BellScheduleMeetingTime.start_time, BellScheduleMeetingTime.end_time
+    ).filter_by(bell_schedule_id=bell_schedule_id))
+
+    removed = stored - meeting_times
+    if removed:
+        # every column but creation_date is part of the primary key
+        db.session.execute(table.delete().where(and_(
+            table.c.bell_schedule_id == bell_schedule_id,
+            or_(*[and_(table.c.classperiod_name == name, table.c.start_time == start, table.c.end_time == end) for name, start, end in removed])
+        )))
+
+    added = meeting_times - stored
+    if added:
+        now = datetime.utcnow()
+        db.session.execute(table.insert(), [
+            {"bell_schedule_id": bell_schedule_id, "classperiod_name": name, "start_time": start, "end_time": end, "creation_date": now}
+            for name, start, end in sorted(added)
+        ])
+
+    return bool(removed or added)
@@ -2,9 +2,12 @@
 Customized Marshmallow-SQLAlchemy and Marshmallow-JSONAPI Schemas to combine Schema Meta data.
 """
 import marshmallow as ma
-from marshmallow_sqlalchemy import SQLAlchemyAutoSchema, auto_field
-from marshmallow_sqlalchemy.fields import Nested
+from marshmallow_sqlalchemy import SQLAlchemyAutoSchema, ModelConverter, auto_field
+from marshmallow_sqlalchemy.fields import Nested, Related, RelatedList
 from marshmallow.fields import Pluck
+from marshmallow.utils import is_collection
+from sqlalchemy import and_, or_
+from sqlalchemy.orm.util import identity_key
 
 from common.db_schema import db
 
@@ -24,12 +27,99 @@ class SessionPluck(Pluck):
                 self.schema.session = self.parent.session
         return super(SessionPluck, self)._deserialize(*args, **kwargs)
 
+class BulkRelatedList(RelatedList):
+    """RelatedList that looks up every related object in a payload with one query, instead of one query per item like Related does.
+
+    Only the related objects of the instance that is being loaded into are looked up. The parts of a key
+    that refer to any other object (or to anything at all, when a new object is being created) are dropped,
+    so that a payload copied from another object (i.e. another school's bell schedule) can't move that
+    object's rows to this one. Items with an incomplete primary key become new objects without being looked
+    up. Objects that are already in the session's identity map are not queried again. The key values are
+    deserialized with the fields for their columns first, so that i.e. times sent as strings are compared
+    and stored as times.
+    """
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        related = self.inner
+        if not is_collection(value):
+            raise self.make_error("invalid")
+        if related.transient or related.columns:
+            return super()._deserialize(value, attr, data, **kwargs)
+
+        model = related.related_model
+        key_names = [prop.key for prop in related.related_keys]
+        key_fields = {prop.key: ModelConverter().property2field(prop) for prop in related.related_keys}
+
+        keys = []
+        errors = {}
+        for index, item in enumerate(value):
+            if not isinstance(item, dict):
+                if len(key_names) != 1:
+                    errors[index] = related.make_error("invalid", value=item, keys=key_names).messages
+                    continue
+                item = {key_names[0]: item}
+            try:
+                keys.append(tuple(
+                    None if item.get(name) is None else key_fields[name].deserialize(item.get(name))
+                    for name in key_names
+                ))
+            except ma.ValidationError as error:
+                errors[index] = error.messages
+        if errors:
+            raise ma.ValidationError(errors)
+
+        # key index -> the value it has to have to refer to the instance being loaded into (None without one)
+        instance = getattr(self.root, "instance", None)
+        parent_mapper = self.root.opts.model.__mapper__
+        relationship = parent_mapper.relationships[self.attribute or self.name]
+        key_columns = [prop.columns[0] for prop in related.related_keys]
+        parent_parts = {}
+        for local, remote in relationship.local_remote_pairs:
+            if remote in key_columns:
+                parent_key = parent_mapper.get_property_by_column(local).key
+                parent_parts[key_columns.index(remote)] = None if instance is None else getattr(instance, parent_key)
+        keys = [
+            tuple(None if index in parent_parts and part != parent_parts[index] else part for index, part in enumerate(key))
+            for key in keys
+        ]
+
+        session = related.session
+        found = {}
+        missing = []
+        for key in keys:
+            if None in key or key in found:
+                continue
+            instance = session.identity_map.get(identity_key(model, key))
+            if instance is not None:
+                found[key] = instance
+            else:
+                missing.append(key)
+
+        if missing:
+            columns = [getattr(model, name) for name in key_names]
+            if len(columns) == 1:
+                condition = columns[0].in_([key[0] for key in missing])
+            else:
+                condition = or_(*[and_(*[column == part for column, part in zip(columns, key)]) for key in missing])
+            for instance in session.query(model).filter(condition):
+                found[tuple(getattr(instance, name) for name in key_names)] = instance
+
+        result = []
+        for key in keys:
+            if key not in found:
+                found[key] = model(**{name: part for name, part in zip(key_names, key) if part is not None})
+            result.append(found[key])
+        return result
+
+
 class SchoolSchema(SQLAlchemyAutoSchema):
     class Meta:
         model = School
         include_relationships = False
         load_instance = True
         include_fk = False
+        # maintained by the model for searching
+        exclude = ('search_name', 'search_acronym')
     
     id = auto_field(dump_only=True)
     creation_date = auto_field(dump_only=True)
@@ -69,4 +159,5 @@ class BellScheduleSchema(SQLAlchemyAutoSchema):
     last_modified = auto_field(dump_only=True)
 
     classes = Nested(BellScheduleMeetingTimeSchema, exclude=("bell_schedule_id", "creation_date"), many=True)
+    meeting_times = BulkRelatedList(Related())
     dates = SessionPluck(BellScheduleDateSchema, "date", many=True)
@@ -0,0 +1,182 @@
+"""
+A faster way to dump model objects with the schemas in common/schemas.py.
+
+Schema.dump looks up and calls several methods per field of every object. For large listings (i.e.
+of bell schedules with all their dates) that takes far longer than encoding the result as JSON.
+`dump` instead compiles each schema (once per set of excluded fields) into a list of
+(key, attribute, converter) entries, with plain functions for the field types used by this API and
+the field's own serialize method for anything else. The output is identical to Schema.dump.
+"""
+import datetime
+from functools import lru_cache
+from operator import attrgetter
+
+from marshmallow import fields
+from marshmallow.utils import missing
+from marshmallow_sqlalchemy.fields import Related
+
+# when set (see helpers.init_metrics), this is called before every dump and returns a function to call once it is done, or None
+dump_timer = None
+
+# bounded because the `fields` query parameter lets clients pick any combination of fields to exclude
+@lru_cache(maxsize=256)
+def get_schema(schema_class, exclude=()):
+    """Returns a shared instance of a schema, for dumping only
+
+    Schemas are not safe to share for loading because load sets the session on the instance.
+
+    Arguments:
+        schema_class {type} -- the schema class, i.e. SchoolSchema
+        exclude {tuple} -- the names of the fields to leave out (default: {()})
+
+    Returns:
+        Schema -- the schema instance
+    """
+    return schema_class(exclude=exclude)
+
+
+def dump(schema_class, obj, many=False, exclude=()):
+    """Serializes model objects the same way as `schema_class(exclude=exclude).dump(obj, many=many)`
+
+    Arguments:
+        schema_class {type} -- the schema class, i.e. SchoolSchema
+        obj -- the object, or the iterable of objects if many is True, to serialize
+
+    Keyword Arguments:
+        many {bool} -- whether obj is an iterable of objects (default: {False})
+        exclude {tuple} -- the names of the fields to leave out (default: {()})
+
+    Returns:
+        the serialized dict or list of dicts
+    """
+    dumper = _compile(get_schema(schema_class, tuple(exclude)))
+    done = dump_timer() if dump_timer is not None else None
+    try:
+        if many:
+            return [dumper(o) for o in obj]
+        return dumper(obj)
+    finally:
+        if done is not None:
+            done()
+
+
+def _optional(convert):
+    return lambda value: None if value is None else convert(value)
+
+
+def _to_bool(field):
+    def convert(value):
+        try:
+            if value in field.truthy:
+                return True
+            if value in field.falsy:
+                return False
+        except TypeError:
+            pass
+        return bool(value)
+    return _optional(convert)
+
+
+def _native(field):
+    """Returns the function that serializes a non-None value the same way as the field, for the field types with a fast path"""
+    field_type = type(field)
+    if field_type is fields.String:
+        return str
+    if field_type is fields.DateTime and field.format in (None, "iso"):
+        return datetime.datetime.isoformat
+    if field_type is fields.Date and field.format in (None, "iso"):
+        return datetime.date.isoformat
+    if field_type is fields.Time and field.format in (None, "iso"):
+        return datetime.time.isoformat
+    return None
+
+
+def _converter(field):
+    """Returns a function that serializes a value the same way as the field, or None if there is no fast path for it"""
+    native = _native(field)
+    if native is not None:
+        return _optional(native)
+    if type(field) is fields.Boolean:
+        return _to_bool(field)
+
+    if isinstance(field, fields.Pluck):
+        if _has_dump_hooks(field.schema):
+            return None
+        plucked = field.schema.dump_fields[field.field_name]
+        if plucked.dump_default is not missing:
+            return None
+        get_plucked = attrgetter(plucked.attribute or field.field_name)
+        native = _native(plucked)
+        if native is not None and field.many:
+            # the common case of a list of dates, without a function call per item
+            return _optional(lambda values: [None if value is None else native(value) for value in map(get_plucked, values)])
+        convert = _converter(plucked)
+        if convert is None:
+            return None
+        convert_one = lambda nested: convert(get_plucked(nested))
+    elif isinstance(field, fields.Nested):
+        convert_one = _compile(field.schema)
+    elif isinstance(field, Related):
+        return _related(field)
+    elif isinstance(field, fields.List) and isinstance(field.inner, Related):
+        convert_one = _related(field.inner)
+        return _optional(lambda values: [convert_one(value) for value in values])
+    else:
+        return None
+
+    if field.many:
+        return _optional(lambda values: [convert_one(value) for value in values])
+    return _optional(convert_one)
+
+
+def _related(field):
+    """Serializes related objects as their primary key (or a dict of them if there are several) like Related does"""
+    keys = [prop.key for prop in field.related_keys]
+    if len(keys) == 1:
+        key = keys[0]
+        return lambda value: getattr(value, key, None)
+    return lambda value: {key: getattr(value, key, None) for key in keys}
+
+
+def _compile(schema):
+    """Builds (and caches on the schema instance) a function that dumps one object with a schema"""
+    dumper = getattr(schema, "_compiled_dumper", None)
+    if dumper is not None:
+        return dumper
+
+    if _has_dump_hooks(schema):
+        dumper = lambda obj: schema.dump(obj)
+    else:
+        plan = []
+        for name, field in schema.dump_fields.items():
+            convert = _converter(field)
+            key = field.data_key if field.data_key is not None else name
+            if convert is None or field.dump_default is not missing:
+                plan.append((key, None, _slow_path(schema, name, field)))
+            else:
+                plan.append((key, field.attribute or name, convert))
+
+        def dumper(obj):
+            result = {}
+            for key, attribute, convert in plan:
+                if attribute is None:
+                    value = convert(obj)
+                    if value is not missing:
+                        result[key] = value
+                else:
+                    # like Schema.dump, fields that the object doesn't have are left out
+                    value = getattr(obj, attribute, missing)
+                    if value is not missing:
+                        result[key] = convert(value)
+            return result
+
+    schema._compiled_dumper = dumper
+    return dumper
+
+
+def _has_dump_hooks(schema):
+    return bool(schema._hooks.get("pre_dump") or schema._hooks.get("post_dump"))
+
+
+def _slow_path(schema, name, field):
+    return lambda obj: field.serialize(name, obj, accessor=schema.get_attribute)
@@ -1,62 +1,134 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 from os import environ as env
 import logging
+import threading
+import time
+
+from common.services import metrics
 
 class Auth0ManagementService:
+    """A client for the Auth0 management API
+
+    Requests are made through a single pooled keep-alive session with per-call timeouts and bounded
+    retries (with exponential backoff) for connection errors and 429/5xx responses. The access token
+    is refreshed shortly before it expires instead of waiting for the API to reject it.
+    """
 
     base_path = "/api/v2"
-    base_url = "https://" + env.get("AUTH0_DOMAIN") + base_path 
 
     headers = {"Content-Type": "application/json"}
 
-    def __init__(self):
-        self.access_token = self.get_token()
+    def __init__(self, domain=None, client_id=None, client_secret=None, scheme="https"):
+        """
+        Keyword Arguments:
+            domain {string} -- the Auth0 domain (default: the AUTH0_DOMAIN environment variable)
+            client_id {string} -- the management API client ID (default: the AUTH0_CLIENT_ID environment variable)
+            client_secret {string} -- the management API client secret (default: the AUTH0_CLIENT_SECRET environment variable)
+            scheme {string} -- the URL scheme used to reach the domain. Only the fake management API used for benchmarking should need this to be anything other than https (default: {"https"})
+        """
+        self.domain = domain or env.get("AUTH0_DOMAIN")
+        self.client_id = client_id or env.get("AUTH0_CLIENT_ID")
+        self.client_secret = client_secret or env.get("AUTH0_CLIENT_SECRET")
 
-    def get_user(self, user_id):
+        self.base_url = scheme + "://" + self.domain + Auth0ManagementService.base_path
+        self.token_url = scheme + "://" + self.domain + "/oauth/token"
+        # missing the trailing slash on the audience can cause problems: https://community.auth0.com/t/getting-service-not-enabled-within-domain-when-requesting-an-api-token/12634
+        self.audience = "https://" + self.domain + Auth0ManagementService.base_path + "/"
 
-        url = Auth0ManagementService.base_url + "/users/" + user_id
-        heads = {**Auth0ManagementService.headers, **
-                 {"Authorization": "Bearer " + self.access_token}}
-        resp = requests.get(url, headers=heads)
+        # (connect, read) timeouts in seconds
+        self.timeout = (float(env.get("AUTH0_CONNECT_TIMEOUT", 3)), float(env.get("AUTH0_READ_TIMEOUT", 5)))
+        # how long before the access token expires to fetch a new one
+        self.token_refresh_margin = int(env.get("AUTH0_TOKEN_REFRESH_MARGIN", 300))
 
-        data = resp.json()
-        return data
-        # print(access_token)
+        retries = Retry(
+            total=int(env.get("AUTH0_MAX_RETRIES", 2)),
+            backoff_factor=float(env.get("AUTH0_RETRY_BACKOFF", 0.2)),
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET", "POST"]),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        self.session = requests.Session()
+        self.session.headers.update(Auth0ManagementService.headers)
+        self.session.mount(scheme + "://", HTTPAdapter(pool_connections=1, pool_maxsize=int(env.get("AUTH0_POOL_SIZE", 10)), max_retries=retries))
+
+        self._token_lock = threading.Lock()
+        self.token_refresh_at = 0
+        self.access_token = self.get_token()
+
+    def get_user(self, user_id):
+        return self._get("/users/" + user_id)
 
     def get_roles_for_user(self, user_id):
-        url = Auth0ManagementService.base_url + "/users/" + user_id + "/roles"
-        heads = {**Auth0ManagementService.headers, **
-                 {"Authorization": "Bearer " + self.access_token}}
-        resp = requests.get(url, headers=heads)
-        data = resp.json()
+        data = self._get("/users/" + user_id + "/roles")
         if isinstance(data, list):
             return data
-        elif (data.get("statusCode") == 401 and "xpired token" in data.get("message")):
-            self.access_token = self.get_token()
-            return self.get_roles_for_user(user_id)
         else:
             logging.error("encountered unexpected auth0 management API response")
             logging.error(data)
             return []
 
-
     def get_token(self):
+        """Requests a new management API access token and records when it should be refreshed
 
+        Returns:
+            string -- the access token, or an empty string if one could not be obtained
+        """
         # TODO: use the auth0 python SDK/lib for this https://github.com/auth0/auth0-python#management-sdk
-        # missing the trailing slash on the audience can cause problems: https://community.auth0.com/t/getting-service-not-enabled-within-domain-when-requesting-an-api-token/12634
         payload = {
-            "client_id": env.get("AUTH0_CLIENT_ID"),
-            "client_secret": env.get("AUTH0_CLIENT_SECRET"),
-            "audience": self.base_url + "/",
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "audience": self.audience,
             "grant_type": "client_credentials"
         }
-        resp = requests.post("https://" + env.get("AUTH0_DOMAIN") + "/oauth/token", data=json.dumps(payload), headers=Auth0ManagementService.headers)
+        requested_at = time.time()
+        resp = self._request("token", "POST", self.token_url, data=json.dumps(payload))
 
         data = resp.json()
         if data.get("error"):
             logging.error("failed to get auth0 management API access token")
             logging.error(data)
+            # try again after a short delay rather than on every call
+            self.token_refresh_at = requested_at + 30
             return ""
         else:
+            expires_in = data.get("expires_in", 86400)
+            # short-lived tokens are refreshed halfway through their lifetime instead
+            self.token_refresh_at = requested_at + max(expires_in - self.token_refresh_margin, expires_in / 2)
             return data["access_token"]
+
+    def _get_access_token(self):
+        """Returns the current access token, refreshing it first if it is about to expire"""
+        if time.time() >= self.token_refresh_at:
+            with self._token_lock:
+                # another thread may have refreshed it while this one was waiting for the lock
+                if time.time() >= self.token_refresh_at:
+                    self.access_token = self.get_token()
+        return self.access_token
+
+    def _get(self, path):
+        """Makes an authenticated GET request to the management API
+
+        If the token is rejected anyway (i.e. because it was revoked), it is refreshed and the request is retried once.
+
+        Returns:
+            the decoded JSON response
+        """
+        url = self.base_url + path
+        resp = self._request("management", "GET", url, headers={"Authorization": "Bearer " + self._get_access_token()})
+        if resp.status_code == 401:
+            with self._token_lock:
+                self.access_token = self.get_token()
+            resp = self._request("management", "GET", url, headers={"Authorization": "Bearer " + self.access_token})
+        return resp.json()
+
+    def _request(self, call, method, url, **kwargs):
+        """Makes a request through the session and records how long it took (including retries) in the metrics, under the name of the call"""
+        started = time.perf_counter()
+        try:
+            return self.session.request(method, url, timeout=self.timeout, **kwargs)
+        finally:
+            metrics.AUTH0_REQUEST_SECONDS.observe(time.perf_counter() - started, (call,))
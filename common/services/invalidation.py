@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from os import environ as env
+from uuid import uuid4
+
+
+class InvalidationBus:
+    """Passes cache invalidation events between the worker processes (and machines) running the API.
+
+    Caches register a handler for a topic with `subscribe`. `publish` runs the handlers of this process
+    immediately and sends the event through the transport so that every other process runs theirs.
+    Events sent by this process are ignored when they come back from the transport.
+
+    A handler is called with the list of keys to invalidate, or with None when everything should be
+    invalidated. The latter happens when the transport may have lost events, for example after it
+    reconnects, because a cache that might have missed an invalidation can't be trusted.
+    """
+
+    def __init__(self, transport=None):
+        self.transport = transport or LocalTransport()
+        self.origin = uuid4().hex
+        self._handlers = {}
+        self._pid = None
+        self._lock = threading.Lock()
+
+        self.published = 0
+        self.received = 0
+        self.resets = 0
+
+    def subscribe(self, topic, handler):
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic, keys=None):
+        """Invalidates keys of a topic in this process and every other process listening on the transport
+
+        Arguments:
+            topic {string} -- what to invalidate, i.e. "responses"
+            keys {list} -- the keys to invalidate. None invalidates everything in the topic (default: {None})
+        """
+        keys = list(keys) if keys is not None else None
+        self._dispatch(topic, keys)
+        self.start()
+        self.published += 1
+        try:
+            self.transport.send(json.dumps({"origin": self.origin, "topic": topic, "keys": keys}))
+        except Exception as e:
+            logging.error("failed to publish a cache invalidation event, other workers may serve stale data until their caches expire")
+            logging.error(e)
+
+    def start(self):
+        """Starts listening for events from other processes if this process isn't already
+
+        This is safe to call often, and is called on every request so that a worker forked after
+        the app was imported (i.e. by gunicorn with --preload) starts its own listener.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.transport.listen(self._receive)
+
+    def stats(self):
+        return {
+            "published": self.published,
+            "received": self.received,
+            "resets": self.resets,
+        }
+
+    def _receive(self, message):
+        if message is None:
+            self.resets += 1
+            for topic in self._handlers:
+                self._dispatch(topic, None)
+            return
+
+        try:
+            event = json.loads(message)
+        except ValueError:
+            logging.error("ignoring malformed cache invalidation event")
+            return
+        if event.get("origin") == self.origin:
+            return
+        self.received += 1
+        self._dispatch(event.get("topic"), event.get("keys"))
+
+    def _dispatch(self, topic, keys):
+        for handler in self._handlers.get(topic, []):
+            try:
+                handler(keys)
+            except Exception as e:
+                logging.error("cache invalidation handler for " + str(topic) + " failed")
+                logging.error(e)
+
+
+class LocalTransport:
+    """A transport that doesn't send events anywhere, for when the API runs in a single process"""
+
+    def send(self, message):
+        pass
+
+    def listen(self, callback):
+        pass
+
+
+class SQLiteTransport:
+    """A transport that passes events through a table in a SQLite database file.
+
+    Every process on the machine that uses the same file receives the events of every other one,
+    which makes this suitable for running several workers on one machine (and for trying out the
+    bus locally), but not for several machines. Each listener polls the table every `poll_interval`
+    seconds, which is the most that other workers lag behind. Events older than `retention`
+    seconds are deleted.
+    """
+
+    def __init__(self, path, poll_interval=None, retention=60):
+        self.path = path
+        self.poll_interval = poll_interval if poll_interval is not None else float(env.get("INVALIDATION_POLL_INTERVAL", 0.5))
+        self.retention = retention
+        self._local = threading.local()
+
+        self._connect().executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS invalidations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                message TEXT NOT NULL
+            );
+        """)
+
+    def _connect(self):
+        # sqlite connections can't be shared between threads
+        connection = getattr(self._local, "connection", None)
+        if connection is None or getattr(self._local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def send(self, message):
+        now = time.time()
+        connection = self._connect()
+        connection.execute("INSERT INTO invalidations (created_at, message) VALUES (?, ?)", (now, message))
+        connection.execute("DELETE FROM invalidations WHERE created_at < ?", (now - self.retention,))
+
+    def listen(self, callback):
+        last_id = self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM invalidations").fetchone()[0]
+
+        def poll():
+            nonlocal last_id
+            while True:
+                time.sleep(self.poll_interval)
+                try:
+                    rows = self._connect().execute(
+                        "SELECT id, message FROM invalidations WHERE id > ? ORDER BY id", (last_id,)
+                    ).fetchall()
+                except sqlite3.Error as e:
+                    logging.error("failed to read cache invalidation events from " + self.path)
+                    logging.error(e)
+                    callback(None)
+                    continue
+                for event_id, message in rows:
+                    last_id = event_id
+                    callback(message)
+
+        threading.Thread(target=poll, name="invalidation-listener", daemon=True).start()
+
+
+class PostgresTransport:
+    """A transport that passes events through PostgreSQL LISTEN/NOTIFY, so that every process on
+    every machine connected to the same database receives them without any extra infrastructure.
+
+    NOTIFY doesn't keep events for listeners that aren't connected, so the handlers are told to
+    invalidate everything whenever the listener has to reconnect.
+    """
+
+    def __init__(self, dsn, channel="classclock_invalidations"):
+        self.dsn = dsn
+        self.channel = channel
+        self._send_connection = None
+        self._send_lock = threading.Lock()
+
+    def _connect(self):
+        import psycopg2
+        connection = psycopg2.connect(self.dsn)
+        connection.autocommit = True
+        return connection
+
+    def send(self, message):
+        with self._send_lock:
+            for attempt in range(2):
+                try:
+                    if self._send_connection is None or self._send_connection.closed:
+                        self._send_connection = self._connect()
+                    with self._send_connection.cursor() as cursor:
+                        cursor.execute("SELECT pg_notify(%s, %s)", (self.channel, message))
+                    return
+                except Exception:
+                    # the connection may have been closed by the server since the last event, so retry once on a new one
+                    self._send_connection = None
+                    if attempt:
+                        raise
+
+    def listen(self, callback):
+        import select
+
+        def wait_for_events():
+            connected_before = False
+            while True:
+                try:
+                    connection = self._connect()
+                    with connection.cursor() as cursor:
+                        cursor.execute("LISTEN " + self.channel)
+                    if connected_before:
+                        callback(None)
+                    connected_before = True
+
+                    while True:
+                        if select.select([connection], [], [], 60) == ([], [], []):
+                            continue
+                        connection.poll()
+                        while connection.notifies:
+                            callback(connection.notifies.pop(0).payload)
+                except Exception as e:
+                    logging.error("lost the connection used to listen for cache invalidation events, reconnecting")
+                    logging.error(e)
+                    connected_before = True
+                    time.sleep(1)
+
+        threading.Thread(target=wait_for_events, name="invalidation-listener", daemon=True).start()
+
+
+def transport_from_url(url):
+    """Creates the transport for a URL from the INVALIDATION_BUS_URL environment variable
+
+    Arguments:
+        url {string} -- `sqlite:///path/to/file.db`, a `postgresql://` connection URL, or None for a LocalTransport
+
+    Returns:
+        the transport
+    """
+    if not url:
+        return LocalTransport()
+    elif url.startswith("sqlite:///"):
+        return SQLiteTransport(url[len("sqlite:///"):])
+    elif url.startswith("postgres://") or url.startswith("postgresql://"):
+        return PostgresTransport(url)
+    raise ValueError("unsupported INVALIDATION_BUS_URL: " + url)
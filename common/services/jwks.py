@@ -0,0 +1,188 @@
+import json
+import logging
+import threading
+import time
+from os import environ as env
+
+from six.moves.urllib.request import urlopen
+
+from common.services import metrics
+
+
+def index_keys(jwks):
+    """Indexes the RSA keys in a JWKS document by key ID
+
+    Arguments:
+        jwks {dict} -- the parsed JWKS document
+
+    Returns:
+        dict -- a map of key IDs to keys in the format expected by jose.jwt.decode
+    """
+    keys = {}
+    for key in jwks["keys"]:
+        keys[key["kid"]] = {
+            "kty": key["kty"],
+            "kid": key["kid"],
+            "use": key.get("use", "sig"),
+            "n": key["n"],
+            "e": key["e"]
+        }
+    return keys
+
+
+class JWKSCache:
+    """An in-process cache of the signing keys published at a JWKS URL, indexed by key ID (kid).
+
+    The key set is fetched once and then served from memory. Once it is older than `ttl` seconds
+    it is refreshed on a background thread while the previous keys keep being served. A `kid`
+    that is not in the cached set (i.e. after the signing keys are rotated) triggers at most one
+    synchronous refetch every `min_refetch_interval` seconds. If a fetch fails, the last good key
+    set is kept.
+    """
+
+    def __init__(self, jwks_url, ttl=None, min_refetch_interval=None, fetch_timeout=None):
+        self.jwks_url = jwks_url
+        self.ttl = ttl if ttl is not None else int(env.get("JWKS_CACHE_TTL", 3600))
+        self.min_refetch_interval = min_refetch_interval if min_refetch_interval is not None else int(env.get("JWKS_MIN_REFETCH_INTERVAL", 30))
+        self.fetch_timeout = fetch_timeout if fetch_timeout is not None else float(env.get("JWKS_FETCH_TIMEOUT", 5))
+
+        self._keys = {}
+        self._fetched_at = None
+        self._last_attempt = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+        self.hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.refetches = 0
+        self.fetch_failures = 0
+
+    def get_key(self, kid):
+        """Returns the JWK with the given key ID, or None if it cannot be found
+
+        Arguments:
+            kid {string} -- the key ID from the header of the token being verified
+
+        Returns:
+            dict -- the RSA key in the format expected by jose.jwt.decode
+        """
+        if self._fetched_at is None:
+            self._fetch(initial=True)
+        elif time.monotonic() - self._fetched_at > self.ttl:
+            self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is not None:
+            self.hits += 1
+            return key
+
+        self.misses += 1
+        # the keys may have been rotated since the last fetch
+        if self._fetch(initial=False):
+            return self._keys.get(kid)
+        return None
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "fetches": self.fetches,
+            "refetches": self.refetches,
+            "fetch_failures": self.fetch_failures,
+            "keys": len(self._keys),
+        }
+
+    def _fetch(self, initial):
+        """Fetches the key set, rate limited to once every `min_refetch_interval` seconds
+
+        Returns:
+            bool -- True if a fetch was attempted and succeeded
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._last_attempt is not None and now - self._last_attempt < self.min_refetch_interval:
+                return False
+            self._last_attempt = now
+
+            if not initial:
+                self.refetches += 1
+            self.fetches += 1
+
+            started = time.perf_counter()
+            try:
+                response = urlopen(self.jwks_url, timeout=self.fetch_timeout)
+                jwks = json.loads(response.read())
+                keys = index_keys(jwks)
+            except Exception as e:
+                self.fetch_failures += 1
+                logging.error("failed to fetch JWKS from " + self.jwks_url + ", continuing to use the last known key set")
+                logging.error(e)
+                return False
+            finally:
+                metrics.AUTH0_REQUEST_SECONDS.observe(time.perf_counter() - started, ("jwks",))
+
+            self._keys = keys
+            self._fetched_at = time.monotonic()
+            return True
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def refresh():
+            try:
+                self._fetch(initial=False)
+            finally:
+                # even if the fetch was rate limited or failed, wait another ttl before trying again
+                # so that every request doesn't spawn a new thread while auth0 is down
+                self._fetched_at = time.monotonic()
+                self._refreshing = False
+
+        threading.Thread(target=refresh, name="jwks-refresh", daemon=True).start()
+
+
+class StaticJWKS:
+    """A fixed set of signing keys loaded once at startup, for verifying tokens without contacting Auth0.
+
+    This has the same interface as JWKSCache.
+    """
+
+    def __init__(self, jwks):
+        self._keys = index_keys(jwks)
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls):
+        """Loads a key set from the AUTH0_JWKS_FILE (a path to a JWKS document) or AUTH0_JWKS (the JWKS document itself) environment variables
+
+        Returns:
+            StaticJWKS -- the loaded key set, or None if neither variable is set
+        """
+        if env.get("AUTH0_JWKS_FILE"):
+            with open(env.get("AUTH0_JWKS_FILE")) as jwks_file:
+                return cls(json.load(jwks_file))
+        elif env.get("AUTH0_JWKS"):
+            return cls(json.loads(env.get("AUTH0_JWKS")))
+        return None
+
+    def get_key(self, kid):
+        key = self._keys.get(kid)
+        if key is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return key
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "fetches": 0,
+            "refetches": 0,
+            "fetch_failures": 0,
+            "keys": len(self._keys),
+        }
@@ -0,0 +1,373 @@
+"""
+Counters, gauges and histograms for monitoring the API, exposed in the Prometheus text format.
+
+Each worker process records into its own MetricsRegistry, which is cheap enough to leave on: a lock
+and a dictionary update per value. When METRICS_DIR is set, a background thread in each worker
+writes the worker's values to its own file in that directory (at most every METRICS_FLUSH_INTERVAL
+seconds, when something changed), and a scrape adds up the files of every worker, so it doesn't
+matter which gunicorn worker answers it. The files of workers that have exited are still counted
+for counters and histograms, so that their totals don't go backwards, but not for gauges. A scrape
+adds them up into one file (COMPACTED_FILENAME) and removes theirs, so the directory doesn't grow
+with every worker that gunicorn restarts.
+Without METRICS_DIR, a scrape only reports the worker that answers it.
+"""
+import atexit
+import bisect
+import json
+import logging
+import math
+import os
+import threading
+import time
+import uuid
+from os import environ as env
+
+try:
+    import fcntl
+except ImportError:
+    # compacting the files of exited workers needs a lock between processes, see MetricsRegistry.compact
+    fcntl = None
+
+METRICS_DIR = env.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = float(env.get("METRICS_FLUSH_INTERVAL", 5))
+
+# where the values of workers that have exited are added up, see MetricsRegistry.compact
+COMPACTED_FILENAME = "compacted.json"
+
+# in seconds
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, registry, name, help, labels=()):
+        self.registry = registry
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        # label values tuple -> value
+        self.values = {}
+
+    def set(self, label_values, value):
+        """Sets the value for a combination of label values, i.e. to mirror a count that is kept elsewhere"""
+        with self.registry.lock:
+            if self.values.get(label_values) != value:
+                self.values[label_values] = value
+                self.registry.version += 1
+
+    def snapshot(self):
+        return {"kind": self.kind, "help": self.help, "labels": self.labels, "values": [[list(k), v] for k, v in self.values.items()]}
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, label_values=(), amount=1):
+        with self.registry.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+            self.registry.version += 1
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, label_values=(), amount=1):
+        with self.registry.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+            self.registry.version += 1
+
+    def dec(self, label_values=(), amount=1):
+        self.inc(label_values, -amount)
+
+
+class Histogram(Metric):
+    """A histogram. Each value is a list of the count in each bucket (not cumulative, the last one is +Inf) followed by the sum"""
+    kind = "histogram"
+
+    def __init__(self, registry, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(registry, name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, label_values=()):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry.lock:
+            counts = self.values.get(label_values)
+            if counts is None:
+                counts = self.values[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+            self.registry.version += 1
+
+    def snapshot(self):
+        result = super().snapshot()
+        result["buckets"] = self.buckets
+        return result
+
+
+class MetricsRegistry:
+    def __init__(self, directory=None, flush_interval=METRICS_FLUSH_INTERVAL):
+        """
+        Keyword Arguments:
+            directory {string} -- a directory shared by all the worker processes to write their values to (default: {None})
+            flush_interval {number} -- how often each worker writes its values, in seconds (default: the METRICS_FLUSH_INTERVAL environment variable, or 5)
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics = {}
+        self.collectors = []
+        self.lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # bumped by every change, so that unchanged values aren't written again
+        self.version = 0
+        self._flushed_version = None
+        self._pid = None
+        self._path = None
+
+    def counter(self, name, help, labels=()):
+        return self._register(Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._register(Gauge(self, name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(self, name, help, labels, buckets))
+
+    def _register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError("a metric named " + metric.name + " already exists")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector):
+        """Registers a function that is called before the values are reported, to update metrics that mirror counts kept elsewhere (i.e. the stats of a cache)"""
+        self.collectors.append(collector)
+
+    def start(self):
+        """Starts writing this worker's values to the shared directory. This is a no-op without one, or if this process has already started it"""
+        if not self.directory or self._pid == os.getpid():
+            return
+        # after a fork, the child gets a file and a thread of its own
+        self._pid = os.getpid()
+        self._path = os.path.join(self.directory, "%d-%s.json" % (self._pid, uuid.uuid4().hex[:8]))
+        self._flushed_version = None
+        os.makedirs(self.directory, exist_ok=True)
+        threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True).start()
+        # so that the last values of a worker that is shut down aren't lost
+        atexit.register(self.flush)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error("failed to write metrics to " + self.directory)
+                logging.error(e)
+
+    def run_collectors(self):
+        for collector in self.collectors:
+            collector()
+
+    def snapshot(self):
+        with self.lock:
+            return {"pid": os.getpid(), "metrics": {name: metric.snapshot() for name, metric in self.metrics.items()}}
+
+    def flush(self):
+        """Writes this worker's values to its file in the shared directory, if they changed since the last time"""
+        if self._path is None or self._pid != os.getpid():
+            return
+        self.run_collectors()
+        # the background thread and a scrape may both be flushing
+        with self._flush_lock:
+            if self.version == self._flushed_version:
+                return
+            version = self.version
+            snapshot = self.snapshot()
+            # written to a temporary file first so that a scrape never reads half of it
+            temporary = self._path + ".tmp"
+            with open(temporary, "w") as output:
+                json.dump(snapshot, output)
+            os.replace(temporary, self._path)
+            self._flushed_version = version
+
+    def collect(self):
+        """Returns the values of every worker (or just this one, without a shared directory), added up"""
+        self.run_collectors()
+        own = self.snapshot()
+        snapshots = [own]
+        if self.directory and os.path.isdir(self.directory):
+            self.flush()
+            self.compact()
+            snapshots += self._read_other_snapshots()
+        return _merge(snapshots, own)
+
+    def _read_other_snapshots(self):
+        """Reads the files of the other workers and the one that the files of exited workers were compacted into"""
+        for _ in range(3):
+            filenames = os.listdir(self.directory)
+            compacted = _read_snapshot(os.path.join(self.directory, COMPACTED_FILENAME))
+            # the files that were compacted but haven't been removed yet
+            merged = set(compacted["merged"]) if compacted else set()
+            snapshots = [compacted] if compacted else []
+            complete = True
+            for filename in filenames:
+                path = os.path.join(self.directory, filename)
+                if not _is_worker_file(filename) or path == self._path or filename in merged:
+                    continue
+                snapshot = _read_snapshot(path)
+                if snapshot is None:
+                    # compacted since the compacted file was read, which has to be read again to include it
+                    complete = False
+                    break
+                snapshots.append(snapshot)
+            if complete:
+                break
+        return snapshots
+
+    def compact(self):
+        """Adds the counters and histograms from the files of workers that have exited to one file and removes theirs
+
+        Otherwise every scrape would read a file for every worker that ever ran, i.e. after every restart
+        of gunicorn's workers. Only one process compacts at a time, and the others skip it.
+        """
+        if fcntl is None:
+            return
+        with open(os.path.join(self.directory, "compact.lock"), "w") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return
+
+            filenames = set(os.listdir(self.directory))
+            compacted_path = os.path.join(self.directory, COMPACTED_FILENAME)
+            compacted = _read_snapshot(compacted_path) or {"pid": None, "metrics": {}, "merged": []}
+            # files that were compacted before, but not removed (i.e. the process was killed in between)
+            leftover = set(compacted["merged"]) & filenames
+            exited = {}
+            for filename in filenames:
+                path = os.path.join(self.directory, filename)
+                if not _is_worker_file(filename) or path == self._path or filename in leftover:
+                    continue
+                snapshot = _read_snapshot(path)
+                if snapshot is not None and not _is_alive(snapshot.get("pid")):
+                    exited[filename] = snapshot
+            if not exited and not compacted["merged"]:
+                return
+
+            # gauges are left out, like they are for exited workers when collecting
+            metrics = _merge([compacted] + list(exited.values()), None)
+            compacted = {
+                "pid": None,
+                "metrics": {name: {**metric, "values": [[list(k), v] for k, v in metric["values"].items()]} for name, metric in metrics.items()},
+                # so that readers skip the files that are in here until they are removed
+                "merged": sorted(leftover | set(exited)),
+            }
+            temporary = compacted_path + ".tmp"
+            with open(temporary, "w") as output:
+                json.dump(compacted, output)
+            os.replace(temporary, compacted_path)
+            for filename in compacted["merged"]:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+
+    def render(self):
+        """Renders the values of every worker in the Prometheus text format (version 0.0.4)"""
+        lines = []
+        for name, metric in sorted(self.collect().items()):
+            lines.append("# HELP %s %s" % (name, metric["help"].replace("\\", "\\\\").replace("\n", "\\n")))
+            lines.append("# TYPE %s %s" % (name, metric["kind"]))
+            labels = metric["labels"]
+            for label_values, value in sorted(metric["values"].items()):
+                pairs = list(zip(labels, label_values))
+                if metric["kind"] == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(list(metric["buckets"]) + [math.inf], value[:-1]):
+                        cumulative += count
+                        lines.append("%s_bucket%s %s" % (name, _format_labels(pairs + [("le", _format_value(bound))]), _format_value(cumulative)))
+                    lines.append("%s_sum%s %s" % (name, _format_labels(pairs), _format_value(value[-1])))
+                    lines.append("%s_count%s %s" % (name, _format_labels(pairs), _format_value(cumulative)))
+                else:
+                    lines.append("%s%s %s" % (name, _format_labels(pairs), _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+
+def _merge(snapshots, own):
+    """Adds up the values in snapshots. Gauges are only included from own and the snapshots of workers that are still running
+
+    Returns:
+        dict -- metric name -> the metric, with its values as a dict of label values tuple -> value
+    """
+    merged = {}
+    for snapshot in snapshots:
+        alive = snapshot is own or _is_alive(snapshot.get("pid"))
+        for name, metric in snapshot["metrics"].items():
+            if metric["kind"] == "gauge" and not alive:
+                continue
+            target = merged.setdefault(name, {**metric, "values": {}})
+            for label_values, value in metric["values"]:
+                key = tuple(label_values)
+                if key not in target["values"]:
+                    target["values"][key] = value
+                elif isinstance(value, list):
+                    target["values"][key] = [a + b for a, b in zip(target["values"][key], value)]
+                else:
+                    target["values"][key] += value
+    return merged
+
+
+def _is_worker_file(filename):
+    return filename.endswith(".json") and filename != COMPACTED_FILENAME
+
+
+def _read_snapshot(path):
+    try:
+        with open(path) as data:
+            return json.load(data)
+    except (OSError, ValueError):
+        # removed, or not written yet
+        return None
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, TypeError):
+        # PermissionError means it exists but belongs to someone else
+        return isinstance(pid, int)
+    return True
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return str(value)
+
+
+registry = MetricsRegistry(directory=METRICS_DIR)
+
+REQUESTS = registry.counter("classclock_http_requests_total", "Requests handled, by endpoint, method and status code", ("endpoint", "method", "status"))
+REQUEST_SECONDS = registry.histogram("classclock_http_request_duration_seconds", "Time taken to handle requests, including streaming the response", ("endpoint", "method"))
+REQUESTS_IN_PROGRESS = registry.gauge("classclock_http_requests_in_progress", "Requests currently being handled")
+SQL_STATEMENTS = registry.histogram(
+    "classclock_sql_statements_per_request", "SQL statements executed per request", ("endpoint",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 20, 50, 100)
+)
+SQL_SECONDS = registry.histogram("classclock_sql_duration_seconds", "Time spent executing SQL statements per request", ("endpoint",))
+SERIALIZATION_SECONDS = registry.histogram("classclock_serialization_duration_seconds", "Time spent serializing response data per request", ("endpoint",))
+AUTH0_REQUEST_SECONDS = registry.histogram("classclock_auth0_request_duration_seconds", "Time taken by requests to Auth0, including retries", ("call",))
+CACHE_HITS = registry.counter("classclock_cache_hits_total", "Lookups that were answered from an in-memory cache", ("cache",))
+CACHE_MISSES = registry.counter("classclock_cache_misses_total", "Lookups that weren't found in an in-memory cache", ("cache",))
+CACHE_EVICTIONS = registry.counter("classclock_cache_evictions_total", "Entries removed from an in-memory cache to make room for new ones", ("cache",))
+CACHE_ENTRIES = registry.gauge("classclock_cache_entries", "Entries in an in-memory cache", ("cache",))
+INVALIDATION_EVENTS = registry.counter("classclock_invalidation_events_total", "Cache invalidations sent to or received from other workers, and resets after the invalidation bus lost messages", ("event",))
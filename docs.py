@@ -53,7 +53,7 @@ def create_docs(app):
     template = spec.to_flasgger(
         app,
         definitions=[SchoolSchema, BellScheduleSchema],
-        paths=[get_school, get_bellschedule ]
+        paths=[get_school, get_bellschedule, get_schedule_for_date ]
     )
 
 
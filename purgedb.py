@@ -0,0 +1,40 @@
+from common.maintenance import DEFAULT_BATCH_SIZE, purge_deleted_schedules, archive_dates
+import argparse
+import datetime
+from os import environ as env
+from api import create_app
+
+parser = argparse.ArgumentParser(description='Permanently delete the bell schedules that were deleted through the API, and optionally archive the dates of past years. Meant to be run on a schedule (i.e. with cron).')
+parser.add_argument('--retention-days', type=int, default=30,
+                    help='how many days to keep deleted bell schedules (and their dates and meeting times) before deleting them permanently (default: 30)')
+parser.add_argument('--archive-dates', action='store_true',
+                    help='also move the dates of bell schedules from before this year to the bellscheduledates_archive table')
+parser.add_argument('--archive-before', type=datetime.date.fromisoformat, metavar='YYYY-MM-DD',
+                    help='with --archive-dates, archive the dates before this one instead of the ones before this year')
+parser.add_argument('--allow-stale-responses', action='store_true',
+                    help="with --archive-dates, run even though INVALIDATION_BUS_URL isn't set, so the running API can keep serving the archived dates from its response cache for up to RESPONSE_CACHE_TTL seconds")
+parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                    help='how many rows to change per transaction (default: %d)' % DEFAULT_BATCH_SIZE)
+parser.add_argument('--dry-run', action='store_true',
+                    help='only count the rows that would be deleted or archived')
+
+args = parser.parse_args()
+if args.retention_days < 0 or args.batch_size < 1:
+	parser.error("--retention-days can't be negative and --batch-size must be at least 1")
+# the API's workers only hear about the archived dates through the invalidation bus. Without one, this process
+# would only invalidate its own (empty) response cache
+if args.archive_dates and not args.dry_run and not env.get("INVALIDATION_BUS_URL") and not args.allow_stale_responses:
+	parser.error("--archive-dates needs INVALIDATION_BUS_URL to be set to the same value as the API's so that the API stops serving the archived dates from its response cache. Pass --allow-stale-responses to archive them anyway")
+
+with create_app().app_context():
+	deleted_before = datetime.datetime.utcnow() - datetime.timedelta(days=args.retention_days)
+	print("Purging bell schedules deleted before " + deleted_before.isoformat(timespec='seconds') + "...")
+	purged = purge_deleted_schedules(deleted_before, batch_size=args.batch_size, dry_run=args.dry_run)
+	print(("Would permanently delete " if args.dry_run else "Permanently deleted ") + str(purged) + " bell schedules.")
+
+	if args.archive_dates:
+		before = args.archive_before or datetime.datetime.utcnow().date().replace(month=1, day=1)
+		print("Archiving bell schedule dates before " + before.isoformat() + "...")
+		archived = archive_dates(before, batch_size=args.batch_size, dry_run=args.dry_run)
+		print(("Would archive " if args.dry_run else "Archived ") + str(archived) + " dates.")
+	print("Done")